@@ -1,46 +1,38 @@
+import zipfile
+from io import BytesIO
+
 from django.contrib import admin
+from django.http import HttpResponse
 from .models import Consultation, SystemSettings, AnalyticsSnapshot
+from .signals import invalidate_consultation_caches
+from .utils import generate_pdf_reports_bulk
 
 
 @admin.register(Consultation)
 class ConsultationAdmin(admin.ModelAdmin):
     list_display = [
-        'patient_name', 
-        'patient_age', 
-        'patient_gender',
+        '__str__',
         'language',
+        'status_display',
         'is_reviewed',
         'created_at'
     ]
     list_filter = [
         'language', 
         'is_reviewed', 
-        'patient_gender',
         'created_at'
     ]
     search_fields = [
-        'patient_name', 
-        'chief_complaint',
+        'clinical_case',
         'diagnosis'
     ]
     readonly_fields = ['created_at', 'updated_at']
     date_hierarchy = 'created_at'
     
     fieldsets = (
-        ('Patient Information', {
-            'fields': (
-                'patient_name', 
-                'patient_age', 
-                'patient_gender'
-            )
-        }),
         ('Clinical Information', {
             'fields': (
-                'chief_complaint', 
-                'symptoms_description', 
-                'duration',
-                'vital_signs', 
-                'medical_history'
+                'clinical_case',
             )
         }),
         ('AI Analysis', {
@@ -61,51 +53,86 @@ class ConsultationAdmin(admin.ModelAdmin):
         }),
     )
     
-    actions = ['mark_as_reviewed', 'mark_as_pending']
+    actions = ['mark_as_reviewed', 'mark_as_pending', 'export_as_pdf']
+    
+    def get_queryset(self, request):
+        # The changelist shows none of the long text columns
+        return super().get_queryset(request).defer(
+            'clinical_case', 'summary', 'diagnosis', 'management'
+        ).with_status()
+    
+    @admin.display(description='Status', ordering='status_label')
+    def status_display(self, obj):
+        return obj.status_label
+    
+    def get_search_results(self, request, queryset, search_term):
+        # Full-text index on PostgreSQL instead of a LIKE '%term%' scan
+        if not search_term.strip():
+            return queryset, False
+        return queryset.search(search_term), False
     
     def mark_as_reviewed(self, request, queryset):
         updated = queryset.update(is_reviewed=True)
+        # update() sends no post_save, so the cached counts are dropped here
+        invalidate_consultation_caches()
         self.message_user(request, f'{updated} consultation(s) marked as reviewed.')
     mark_as_reviewed.short_description = "Mark selected as reviewed"
     
     def mark_as_pending(self, request, queryset):
         updated = queryset.update(is_reviewed=False)
+        invalidate_consultation_caches()
         self.message_user(request, f'{updated} consultation(s) marked as pending.')
     mark_as_pending.short_description = "Mark selected as pending review"
+    
+    def export_as_pdf(self, request, queryset):
+        # The reports need the text columns the changelist defers. Rows are
+        # fetched in chunks and each PDF goes into the zip as soon as it is
+        # rendered, so only the (compressed) archive grows.
+        reports = generate_pdf_reports_bulk(queryset.defer(None).iterator(chunk_size=500))
+        
+        buffer = BytesIO()
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+            for report, pdf in reports:
+                filename = f"consultation_{report.pk}_{report.created_at.strftime('%Y%m%d')}.pdf"
+                archive.writestr(filename, pdf.getbuffer())
+        
+        response = HttpResponse(buffer.getvalue(), content_type='application/zip')
+        response['Content-Disposition'] = 'attachment; filename="consultations.zip"'
+        return response
+    export_as_pdf.short_description = "Export selected as PDF"
 
 
 @admin.register(SystemSettings)
 class SystemSettingsAdmin(admin.ModelAdmin):
     list_display = [
-        'api_provider',
-        'model_name',
-        'is_configured',
+        '__str__',
+        'model_loaded',
         'updated_at'
     ]
     readonly_fields = ['updated_at']
     
     fieldsets = (
-        ('API Configuration', {
+        ('Model Configuration', {
+            'fields': (
+                'model_loaded',
+                'model_path'
+            )
+        }),
+        ('Generation Parameters', {
             'fields': (
-                'api_provider',
-                'api_key',
-                'api_url',
-                'model_name',
-                'custom_model_name',
-                'temperature',
-                'max_tokens'
+                'max_input_length',
+                'max_output_length',
+                'temperature'
             )
         }),
         ('System Preferences', {
             'fields': (
-                'enable_notifications',
-                'default_language'
+                'default_language',
             )
         }),
         ('Metadata', {
             'fields': (
                 'updated_at',
-                'updated_by'
             )
         }),
     )
@@ -123,16 +150,13 @@ class SystemSettingsAdmin(admin.ModelAdmin):
 class AnalyticsSnapshotAdmin(admin.ModelAdmin):
     list_display = [
         'date',
-        'total_consultations',
-        'avg_processing_time'
+        'total_consultations'
     ]
     list_filter = ['date']
     readonly_fields = [
         'date',
         'total_consultations',
-        'consultations_by_language',
-        'top_diagnoses',
-        'avg_processing_time'
+        'consultations_by_language'
     ]
     
     def has_add_permission(self, request):
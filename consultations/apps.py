@@ -1,8 +1,35 @@
+import os
 from django.apps import AppConfig
+from django.conf import settings
 class ConsultationsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'consultations'
 
     def ready(self):
-        print("System ready. Using Hugging Face Inference API for predictions.")
-        pass
\ No newline at end of file
+        # Connect the cache invalidation receivers
+        from . import signals  # noqa: F401
+
+        # One OpenMP/MKL pool per worker process, sized to its share of the
+        # cores, so gunicorn workers don't oversubscribe the CPU. Must be set
+        # before torch/onnxruntime are first imported.
+        workers = int(os.environ.get('WEB_CONCURRENCY', '1'))
+        threads = str(max(1, (os.cpu_count() or 1) // workers))
+        os.environ.setdefault('OMP_NUM_THREADS', threads)
+        os.environ.setdefault('MKL_NUM_THREADS', threads)
+        # No OMP_PROC_BIND / KMP_AFFINITY: without a per-worker offset every
+        # worker would pin its threads to the same first cores
+
+        # Only server processes preload the model: the runserver child
+        # (RUN_MAIN=true; the autoreloader parent serves nothing) and web
+        # processes started with ML_PRELOAD_MODEL (see Procfile). migrate,
+        # cron commands etc. skip it; requests load it on first use.
+        if os.environ.get('RUN_MAIN') != 'true' and not settings.ML_PRELOAD_MODEL:
+            return
+
+        # Build the local ONNX Runtime sessions once per process
+        from .ml_service import MLService
+        MLService.ensure_loaded()
+        if MLService.is_loaded():
+            print("System ready. Using the local ONNX model for predictions.")
+        else:
+            print("System ready. Using Hugging Face Inference API for predictions.")
@@ -0,0 +1,61 @@
+import csv
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from consultations.models import Consultation
+from consultations.signals import invalidate_consultation_caches
+
+
+class Command(BaseCommand):
+    help = "Import consultations from a CSV file (clinical_case column required)"
+
+    # Optional columns copied onto each row when present
+    optional_fields = ('summary', 'diagnosis', 'management', 'language')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV file with a header row')
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Rows per multi-row INSERT'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = max(options['batch_size'], 1)
+        try:
+            handle = open(options['path'], newline='', encoding='utf-8')
+        except OSError as e:
+            raise CommandError(f"Could not open {options['path']}: {e}")
+
+        created = 0
+        with handle, transaction.atomic():
+            reader = csv.DictReader(handle)
+            if 'clinical_case' not in (reader.fieldnames or ()):
+                raise CommandError("CSV must have a clinical_case column")
+
+            # One INSERT per batch rather than one per row, without
+            # holding the whole file in memory
+            rows = (self.build(row, reader.line_num) for row in reader)
+            while batch := list(islice(rows, batch_size)):
+                Consultation.objects.bulk_create(batch, batch_size=batch_size)
+                created += len(batch)
+
+        # bulk_create() sends no post_save, so the stats caches and history
+        # counts have to be dropped here
+        if created:
+            invalidate_consultation_caches()
+        self.stdout.write(self.style.SUCCESS(f"Imported {created} consultation(s)"))
+
+    def build(self, row, line):
+        fields = {name: row[name] for name in self.optional_fields if row.get(name)}
+        consultation = Consultation(clinical_case=row['clinical_case'] or '', **fields)
+        try:
+            # Field checks only (choices, blank, max_length); nothing is
+            # unique beyond the pk, so skip the per-row uniqueness queries
+            consultation.full_clean(validate_unique=False)
+        except ValidationError as e:
+            errors = '; '.join(f"{field}: {' '.join(messages)}" for field, messages in e.message_dict.items())
+            raise CommandError(f"Line {line}: {errors}")
+        return consultation
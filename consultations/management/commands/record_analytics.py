@@ -0,0 +1,25 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from consultations.models import AnalyticsSnapshot
+
+
+class Command(BaseCommand):
+    help = "Record daily AnalyticsSnapshot rows (yesterday by default, or backfill with --days)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=1,
+            help='Number of finished days to record, ending yesterday'
+        )
+
+    def handle(self, *args, **options):
+        # Only finished days: the analytics page treats snapshots as final
+        end = timezone.now().date() - timedelta(days=1)
+        start = end - timedelta(days=max(options['days'], 1) - 1)
+        snapshots = AnalyticsSnapshot.record(start, end)
+        self.stdout.write(self.style.SUCCESS(
+            f"Recorded {len(snapshots)} snapshot(s) from {start} to {end}"
+        ))
@@ -0,0 +1,60 @@
+import logging
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+
+def query_count():
+    # connection.queries is only recorded while DEBUG is on
+    return len(connection.queries)
+
+
+class QueryCountMiddleware:
+    """
+    DEBUG only: warn about any request that runs more queries than
+    settings.QUERY_COUNT_WARNING, which usually means an N+1 in the view.
+    Streaming responses are skipped: their queries run while the body is
+    sent, after the count is taken.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.threshold = getattr(settings, 'QUERY_COUNT_WARNING', 20)
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+
+        start = query_count()
+        response = self.get_response(request)
+        self.check(request, response, query_count() - start)
+        return response
+
+    async def __acall__(self, request):
+        # Connections are per thread. Under ASGI the request's ORM work
+        # (sync views, async ORM calls) runs in its thread-sensitive
+        # executor thread, so the count is read there too.
+        count = sync_to_async(query_count)
+        start = await count()
+        response = await self.get_response(request)
+        self.check(request, response, await count() - start)
+        return response
+
+    def check(self, request, response, count):
+        if response.streaming or count <= self.threshold:
+            return
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else request.path
+        logger.warning(
+            "%s ran %d queries (threshold %d): %s",
+            view, count, self.threshold, request.path,
+        )
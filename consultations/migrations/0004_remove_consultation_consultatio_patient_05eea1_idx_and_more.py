@@ -0,0 +1,82 @@
+# Generated by Django 5.2.8 on 2026-10-15 01:02
+
+from django.db import migrations, models
+
+GENDERS = {'M': 'Male', 'F': 'Female', 'O': 'Other'}
+
+
+def copy_legacy_fields(apps, schema_editor):
+    """
+    Write the old patient fields into clinical_case before they are
+    dropped, one labelled line each, so existing consultations keep
+    their content. Going back to 0003 cannot split them out again.
+    """
+    Consultation = apps.get_model('consultations', 'Consultation')
+    for consultation in Consultation.objects.iterator():
+        fields = [
+            ('Patient', consultation.patient_name),
+            ('Age', consultation.patient_age),
+            ('Gender', GENDERS.get(consultation.patient_gender, consultation.patient_gender)),
+            ('Chief complaint', consultation.chief_complaint),
+            ('Symptoms', consultation.symptoms_description),
+            ('Duration', consultation.duration),
+            ('Vital signs', consultation.vital_signs),
+            ('Medical history', consultation.medical_history),
+        ]
+        consultation.clinical_case = '\n'.join(
+            f"{label}: {value}" for label, value in fields if value not in (None, '')
+        )
+        consultation.save(update_fields=['clinical_case'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('consultations', '0003_rename_api_key_systemsettings_model_path_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='consultation',
+            name='clinical_case',
+            field=models.TextField(default='', help_text='Full clinical case narrative including symptoms, history, and observations.'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(copy_legacy_fields, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='consultation',
+            name='consultatio_patient_05eea1_idx',
+        ),
+        migrations.RemoveField(
+            model_name='consultation',
+            name='chief_complaint',
+        ),
+        migrations.RemoveField(
+            model_name='consultation',
+            name='duration',
+        ),
+        migrations.RemoveField(
+            model_name='consultation',
+            name='medical_history',
+        ),
+        migrations.RemoveField(
+            model_name='consultation',
+            name='patient_age',
+        ),
+        migrations.RemoveField(
+            model_name='consultation',
+            name='patient_gender',
+        ),
+        migrations.RemoveField(
+            model_name='consultation',
+            name='patient_name',
+        ),
+        migrations.RemoveField(
+            model_name='consultation',
+            name='symptoms_description',
+        ),
+        migrations.RemoveField(
+            model_name='consultation',
+            name='vital_signs',
+        ),
+    ]
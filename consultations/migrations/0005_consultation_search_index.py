@@ -0,0 +1,39 @@
+from django.db import migrations
+
+
+INDEX_NAME = 'consultation_search_gin'
+
+
+def create_search_index(apps, schema_editor):
+    # Full-text search is PostgreSQL-only; SQLite keeps substring search
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    from django.contrib.postgres.indexes import GinIndex
+    from django.contrib.postgres.search import SearchVector
+
+    Consultation = apps.get_model('consultations', 'Consultation')
+    # Must match the expression in ConsultationQuerySet.search
+    index = GinIndex(
+        SearchVector('clinical_case', 'diagnosis', 'management', config='simple'),
+        name=INDEX_NAME,
+    )
+    schema_editor.add_index(Consultation, index)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    schema_editor.execute(f'DROP INDEX IF EXISTS "{INDEX_NAME}"')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('consultations', '0004_remove_consultation_consultatio_patient_05eea1_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.8 on 2026-10-15 01:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('consultations', '0005_consultation_search_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='consultation',
+            index=models.Index(condition=models.Q(('is_reviewed', False)), fields=['-created_at'], name='consult_pending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='consultation',
+            index=models.Index(fields=['is_reviewed', '-created_at'], name='consultatio_is_revi_4e33da_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-15 01:07
+
+import consultations.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('consultations', '0006_consultation_pending_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='analyticssnapshot',
+            name='consultations_by_language',
+            field=models.JSONField(decoder=consultations.models.OrjsonDecoder, default=dict, encoder=consultations.models.OrjsonEncoder),
+        ),
+    ]
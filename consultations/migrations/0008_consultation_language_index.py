@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-15 01:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('consultations', '0007_analyticssnapshot_orjson'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='consultation',
+            index=models.Index(fields=['language'], name='consultatio_languag_43c20e_idx'),
+        ),
+    ]
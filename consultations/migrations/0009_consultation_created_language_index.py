@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-15 01:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('consultations', '0008_consultation_language_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='consultation',
+            index=models.Index(fields=['created_at', 'language'], name='consultatio_created_c65075_idx'),
+        ),
+    ]
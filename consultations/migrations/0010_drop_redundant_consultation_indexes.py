@@ -0,0 +1,21 @@
+# Generated by Django 5.2.8 on 2026-10-15 01:36
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('consultations', '0009_consultation_created_language_index'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='consultation',
+            name='consultatio_created_f5405e_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='consultation',
+            name='consult_pending_idx',
+        ),
+    ]
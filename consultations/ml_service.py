@@ -1,26 +1,285 @@
 import os
 import json
-import re
+import hashlib
+import shutil
+import tempfile
+import time
+import queue
+from threading import Lock, Thread
+from asgiref.sync import sync_to_async
 from django.conf import settings
-from huggingface_hub import InferenceClient
+from django.core.cache import cache
+
+from .utils import parse_sections
+
+
+def _generate(model, **kwargs):
+    """
+    Run model.generate() under torch.inference_mode(). The mode is
+    thread-local, so it is entered inside whichever thread generates.
+    """
+    import torch
+
+    with torch.inference_mode():
+        return model.generate(**kwargs)
+
 
 class MLService:
     """
-    Service for Hugging Face Inference API.
-    Replaces the local PyTorch model with cloud API calls.
+    Service for local T5 inference with ONNX Runtime.
+    Replaces the Hugging Face Inference API calls with an in-process
+    encoder / decoder-with-past session pair.
     """
-    
+
+    # Sessions are built once per process (see ConsultationsConfig.ready)
+    _model = None
+    _tokenizer = None
+    _prefix_ids = None
+    _draft_model = None
+    _pad_to_bucket = False
+    _load_lock = Lock()
+    _load_attempted = False
+    model_dir = None
+    precision = None
+    provider = None
+
+    # Your specific fine-tuned model on Hugging Face
+    repo_id = "Nossim/my-t5-finetuned"
+    max_new_tokens = 512
+    input_buckets = (128, 256, 512)
+
+    # Stream flushing: at most this many tokens or seconds per chunk
+    flush_tokens = 8
+    flush_interval = 0.05
+    # Longest wait for the next token before the stream is abandoned
+    stream_timeout = 60
+
+    # Generated text is cached per prompt; hits are sent as a single chunk
+    cache_timeout = 60 * 60 * 24
+
     def __init__(self):
-        # Load token from environment or settings
-        self.api_token = os.environ.get("HF_TOKEN") or getattr(settings, 'HF_API_TOKEN', None)
-        # Your specific fine-tuned model on Hugging Face
-        self.repo_id = "Nossim/my-t5-finetuned"  
-        
-        if self.api_token:
-            self.client = InferenceClient(model=self.repo_id, token=self.api_token)
+        self.ensure_loaded()
+
+        self.model = MLService._model
+        self.tokenizer = MLService._tokenizer
+        self.prefix_ids = MLService._prefix_ids
+        self.draft_model = MLService._draft_model
+        self.pad_to_bucket = MLService._pad_to_bucket
+
+    @classmethod
+    def load_model(cls):
+        """
+        Export the model to ONNX (first run only) and build the ORT sessions.
+        """
+        try:
+            import onnxruntime as ort
+            from optimum.onnxruntime import ORTModelForSeq2SeqLM
+            from transformers import AutoTokenizer
+        except ImportError:
+            print("Warning: onnxruntime/optimum not installed. MLService will fail if called.")
+            return
+
+        export_dir = os.environ.get("ONNX_MODEL_DIR") or getattr(
+            settings, 'ONNX_MODEL_DIR', os.path.join(settings.BASE_DIR, 'onnx_model')
+        )
+
+        session_options = ort.SessionOptions()
+        session_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        session_options.intra_op_num_threads = int(
+            os.environ.get('OMP_NUM_THREADS', os.cpu_count())
+        )
+
+        available = ort.get_available_providers()
+        if 'CUDAExecutionProvider' in available:
+            provider = 'CUDAExecutionProvider'
+        elif 'OpenVINOExecutionProvider' in available:
+            provider = 'OpenVINOExecutionProvider'
         else:
-            self.client = None
-            print("Warning: HF_TOKEN not found. MLService will fail if called.")
+            provider = 'CPUExecutionProvider'
+
+        try:
+            cls._build_once(export_dir, cls._export)
+
+            model_dir = export_dir
+            precision = 'fp32'
+            file_names = {}
+            if getattr(settings, 'ML_ENABLE_INT8', False) and provider == 'CPUExecutionProvider':
+                model_dir = cls._quantize(export_dir)
+                precision = 'int8'
+                file_names = {
+                    'encoder_file_name': 'encoder_model_quantized.onnx',
+                    'decoder_file_name': 'decoder_model_quantized.onnx',
+                    'decoder_with_past_file_name': 'decoder_with_past_model_quantized.onnx',
+                }
+            elif getattr(settings, 'ML_ENABLE_FP16', False) and provider == 'CUDAExecutionProvider':
+                model_dir = cls._export_fp16(export_dir)
+                precision = 'fp16'
+
+            model = ORTModelForSeq2SeqLM.from_pretrained(
+                model_dir,
+                use_cache=True,
+                provider=provider,
+                session_options=session_options,
+                **file_names,
+            )
+            tokenizer = AutoTokenizer.from_pretrained(export_dir)
+        except Exception as e:
+            print(f"Warning: Could not load ONNX model ({e}). MLService will fail if called.")
+            return
+
+        # Optional draft model for speculative (assisted) decoding. It must
+        # share the T5 vocabulary; without it generation is unchanged.
+        draft_repo_id = getattr(settings, 'ML_DRAFT_MODEL', '')
+        if draft_repo_id:
+            draft_dir = f"{export_dir}_draft"
+            try:
+                cls._build_once(draft_dir, lambda tmp_dir: cls._export(tmp_dir, repo_id=draft_repo_id))
+                cls._draft_model = ORTModelForSeq2SeqLM.from_pretrained(
+                    draft_dir,
+                    use_cache=True,
+                    provider=provider,
+                    session_options=session_options,
+                )
+            except Exception as e:
+                print(f"Warning: Could not load draft model ({e}). Decoding without it.")
+
+        # Warm up once so session initialisation and the first kernel
+        # selection happen at startup, not on the first consultation
+        try:
+            _generate(model, **tokenizer("summarize: warm up", return_tensors='pt'), max_new_tokens=8)
+        except Exception as e:
+            print(f"Warning: ONNX model warm-up failed ({e}).")
+
+        cls._model = model
+        cls._tokenizer = tokenizer
+        cls.model_dir = model_dir
+        cls.precision = precision
+        cls.provider = provider
+        # OpenVINO compiles per input shape; the CPU/CUDA providers handle
+        # dynamic shapes natively, where padding would only add work
+        cls._pad_to_bucket = provider == 'OpenVINOExecutionProvider'
+        # The task prefix never changes, so tokenize it once
+        cls._prefix_ids = tokenizer(
+            "summarize:", add_special_tokens=False, return_tensors='pt'
+        ).input_ids
+
+    @classmethod
+    def ensure_loaded(cls):
+        """
+        Load the model unless this process already tried. A failed load
+        (e.g. onnxruntime not installed) is not retried on every request.
+        """
+        if cls._load_attempted:
+            return
+        # Threaded servers: only one request should build the sessions
+        with cls._load_lock:
+            if not cls._load_attempted:
+                cls.load_model()
+                cls._load_attempted = True
+
+    @classmethod
+    def is_loaded(cls):
+        return cls._model is not None
+
+    def smoke_test(self):
+        """
+        Run a few decoding steps on a fixed prompt and return the text.
+        """
+        inputs = self.tokenizer("summarize: Patient reports a mild headache.", return_tensors='pt')
+        output_ids = _generate(self.model, **inputs, max_new_tokens=16)
+        return self.tokenizer.decode(output_ids[0], skip_special_tokens=True)
+
+    @classmethod
+    def _load_checkpoint(cls, repo_id=None, **kwargs):
+        """
+        Load the PyTorch checkpoint for export from safetensors only.
+        The file is memory-mapped instead of unpickled; there is no
+        pytorch_model.bin fallback.
+        """
+        from transformers import AutoModelForSeq2SeqLM
+
+        return AutoModelForSeq2SeqLM.from_pretrained(
+            repo_id or cls.repo_id, use_safetensors=True, low_cpu_mem_usage=True, **kwargs
+        )
+
+    @staticmethod
+    def _build_once(target_dir, build):
+        """
+        Run build(tmp_dir) and move the result to target_dir, unless it
+        already exists. A file lock makes workers that start together wait
+        for one build; building elsewhere and renaming means an interrupted
+        build leaves no half-written target_dir, so the next start retries.
+        """
+        if os.path.isdir(target_dir):
+            return target_dir
+
+        from filelock import FileLock
+
+        parent = os.path.dirname(os.path.abspath(target_dir))
+        os.makedirs(parent, exist_ok=True)
+        with FileLock(f"{target_dir}.lock"):
+            # Another worker may have finished while we waited
+            if not os.path.isdir(target_dir):
+                tmp_dir = tempfile.mkdtemp(dir=parent, prefix=f".{os.path.basename(target_dir)}-")
+                try:
+                    build(tmp_dir)
+                    os.replace(tmp_dir, target_dir)
+                except BaseException:
+                    shutil.rmtree(tmp_dir, ignore_errors=True)
+                    raise
+        return target_dir
+
+    @classmethod
+    def _export(cls, export_dir, repo_id=None):
+        """
+        Export the Hugging Face checkpoint to ONNX and save it with its tokenizer.
+        """
+        from optimum.exporters.onnx import onnx_export_from_model
+        from transformers import AutoTokenizer
+
+        # Produces encoder_model.onnx + decoder_model.onnx + decoder_with_past_model.onnx
+        onnx_export_from_model(
+            cls._load_checkpoint(repo_id),
+            output=export_dir,
+            task='text2text-generation-with-past',
+        )
+        AutoTokenizer.from_pretrained(repo_id or cls.repo_id).save_pretrained(export_dir)
+
+    @classmethod
+    def _export_fp16(cls, export_dir):
+        """
+        Export a half-precision copy of the model for the CUDA provider (first run only).
+        """
+        import torch
+        from optimum.exporters.onnx import onnx_export_from_model
+
+        def build(tmp_dir):
+            onnx_export_from_model(
+                cls._load_checkpoint(torch_dtype=torch.float16).to('cuda'),
+                output=tmp_dir,
+                task='text2text-generation-with-past',
+                device='cuda',
+            )
+
+        return cls._build_once(f"{export_dir}_fp16", build)
+
+    @classmethod
+    def _quantize(cls, export_dir):
+        """
+        Dynamically quantize the exported graphs to INT8 (first run only).
+        Weights of MatMul/Gemm nodes become int8, activations are quantized
+        on the fly, so VNNI-capable CPUs use int8 dot products.
+        """
+        from optimum.onnxruntime import ORTQuantizer
+        from optimum.onnxruntime.configuration import AutoQuantizationConfig
+
+        def build(tmp_dir):
+            qconfig = AutoQuantizationConfig.avx512_vnni(is_static=False, per_channel=False)
+            for file_name in ('encoder_model.onnx', 'decoder_model.onnx', 'decoder_with_past_model.onnx'):
+                quantizer = ORTQuantizer.from_pretrained(export_dir, file_name=file_name)
+                quantizer.quantize(save_dir=tmp_dir, quantization_config=qconfig)
+
+        return cls._build_once(f"{export_dir}_int8", build)
 
     def create_prompt(self, consultation):
         """
@@ -29,88 +288,140 @@ class MLService:
         # T5-base usually expects a specific prefix like "summarize: "
         return f"summarize: {consultation.clinical_case}"
 
-    def stream_response(self, consultation):
+    def encode_prompt(self, consultation):
         """
-        Generator that streams the response from Hugging Face API.
-        Yields chunks of text for the frontend.
+        Tokenize only the clinical case and prepend the cached prefix ids.
+        Equivalent to tokenizing create_prompt(consultation).
         """
-        if not self.client:
-            yield 'data: {"type": "error", "message": "Server Config Error: HF_TOKEN missing"}\n\n'
-            return
+        import torch
 
-        prompt = self.create_prompt(consultation)
-        full_response = ""
+        body_ids = self.tokenizer.encode(consultation.clinical_case, return_tensors='pt')
+        input_ids = torch.cat([self.prefix_ids, body_ids], dim=1)
+        attention_mask = torch.ones_like(input_ids)
 
-        try:
-            # Call HF API with streaming
-            stream = self.client.text_generation(
-                prompt, 
-                max_new_tokens=512, 
-                stream=True
+        if self.pad_to_bucket:
+            # Fixed shapes let shape-specialising providers reuse compiled
+            # graphs; the mask keeps the encoder output unchanged
+            length = input_ids.size(1)
+            bucket = next((b for b in self.input_buckets if length <= b), length)
+            input_ids = torch.nn.functional.pad(
+                input_ids, (0, bucket - length), value=self.tokenizer.pad_token_id
             )
+            attention_mask = torch.nn.functional.pad(attention_mask, (0, bucket - length))
 
-            for token in stream:
-                # Some versions of the library return an object, others a string. Handle both.
-                content = token if isinstance(token, str) else token.token.text
-                
-                # Yield content to the view loop
-                yield content
-                full_response += content
+        return {'input_ids': input_ids, 'attention_mask': attention_mask}
+
+    def cache_key(self, consultation):
+        """
+        Cache key for a consultation's generated text, from a hash of its prompt.
+        """
+        digest = hashlib.blake2b(
+            self.create_prompt(consultation).encode(), digest_size=16
+        ).hexdigest()
+        return f"mlservice:{self.repo_id}:{digest}"
+
+    async def astream_response(self, consultation):
+        """
+        Stream the response from the local ONNX model for the ASGI view.
+        Yields chunks of text for the frontend and saves the final result to DB.
+        Generation blocks, so each step runs in a worker thread; the cache
+        and the save stay in the caller's context.
+        Identical prompts are served from the cache without running the model.
+        """
+        if not self.model:
+            raise Exception("Server Config Error: ONNX model not loaded")
+
+        parts = []
+
+        try:
+            key = self.cache_key(consultation)
+            cached = await cache.aget(key)
+            if cached is not None:
+                # Nothing to wait for, so one SSE frame instead of
+                # re-slicing the text into many small ones
+                parts.append(cached)
+                yield cached
+            else:
+                chunks = self._stream_generate(consultation)
+                next_chunk = sync_to_async(next, thread_sensitive=False)
+                while (content := await next_chunk(chunks, None)) is not None:
+                    parts.append(content)
+                    yield content
+
+            full_response = "".join(parts)
+            if cached is None:
+                await cache.aset(key, full_response, self.cache_timeout)
 
             # After streaming is done, parse and save the full result
-            parsed_data = self._parse_response(full_response)
-            
-            # Save to Database
+            parsed_data = parse_sections(full_response)
+
             consultation.summary = parsed_data['summary']
             consultation.diagnosis = parsed_data['diagnosis']
             consultation.management = parsed_data['management']
-            consultation.save()
+            await consultation.asave(update_fields=['summary', 'diagnosis', 'management', 'updated_at'])
 
         except Exception as e:
             # Raise exception so the view can capture it
-            raise Exception(f"HF API Error: {str(e)}")
-
-    def _parse_response(self, text):
-        """
-        Parse the raw model output text into structured dictionary.
-        Expects format like: "Summary: ... Diagnosis: ... Management: ..."
-        """
-        text = text.strip()
-        
-        summary = ""
-        diagnosis = ""
-        management = ""
-
-        # Use Regex to extract sections safely (Case Insensitive)
-        diag_match = re.search(r'diagnosis[:\s]+', text, re.IGNORECASE)
-        mgmt_match = re.search(r'management[:\s]+', text, re.IGNORECASE)
-
-        if diag_match and mgmt_match:
-            # Summary is everything before Diagnosis
-            summary_end = diag_match.start()
-            summary = text[:summary_end].replace("Summary:", "").strip()
-            
-            # Diagnosis is everything between Diagnosis and Management
-            diag_start = diag_match.end()
-            diag_end = mgmt_match.start()
-            diagnosis = text[diag_start:diag_end].strip()
-            
-            # Management is everything after Management
-            mgmt_start = mgmt_match.end()
-            management = text[mgmt_start:].strip()
-            
-        elif diag_match:
-            # Fallback: Found Diagnosis but not Management
-            summary_end = diag_match.start()
-            summary = text[:summary_end].replace("Summary:", "").strip()
-            diagnosis = text[diag_match.end():].strip()
-            
-        else:
-            # Fallback: No structure found, put everything in Summary
-            summary = text
-
-        return {
-            "summary": summary,
-            "diagnosis": diagnosis,
-            "management": management
-        }
\ No newline at end of file
+            raise Exception(f"ONNX Runtime Error: {str(e)}")
+
+    def _stream_generate(self, consultation):
+        """
+        Run the model for one consultation and yield coalesced text chunks.
+        """
+        from transformers import TextIteratorStreamer
+
+        inputs = self.encode_prompt(consultation)
+
+        # generate() keeps the encoder output and KV cache internally;
+        # the streamer hands back decoded deltas as tokens arrive
+        streamer = TextIteratorStreamer(
+            self.tokenizer, skip_prompt=True, skip_special_tokens=True,
+            timeout=self.stream_timeout,
+        )
+        generation_kwargs = dict(
+            **inputs,
+            streamer=streamer,
+            max_new_tokens=self.max_new_tokens,
+            num_beams=1,
+            do_sample=False,
+            use_cache=True,
+        )
+        if self.draft_model is not None:
+            # The draft proposes several tokens, the main model verifies
+            # them in one forward pass.
+            generation_kwargs['assistant_model'] = self.draft_model
+
+        errors = []
+
+        def run():
+            try:
+                _generate(self.model, **generation_kwargs)
+            except Exception as e:
+                # generate() only ends the streamer when it finishes; end
+                # it here too, or the loop below would wait forever
+                errors.append(e)
+                streamer.end()
+
+        Thread(target=run, daemon=True).start()
+
+        # Coalesce tokens so each SSE frame (and network flush) carries
+        # several of them instead of one
+        buffer = []
+        last_flush = time.monotonic()
+        try:
+            for content in streamer:
+                if content:
+                    buffer.append(content)
+                if buffer and (len(buffer) >= self.flush_tokens
+                               or time.monotonic() - last_flush > self.flush_interval):
+                    yield ''.join(buffer)
+                    buffer.clear()
+                    last_flush = time.monotonic()
+        except queue.Empty:
+            raise TimeoutError(f"no token from the model for {self.stream_timeout}s")
+
+        if errors:
+            raise errors[0]
+
+        if buffer:
+            yield ''.join(buffer)
@@ -172,9 +172,79 @@
 #         return f"Analytics for {self.date}"
 
 
-from django.db import models
+import json
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+import orjson
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections, models
+from django.db.models import Case, CharField, Count, Q, Value, When
+from django.db.models.functions import Left
 from django.utils import timezone
 
+
+class OrjsonEncoder(DjangoJSONEncoder):
+    """JSONField encoder backed by orjson; DjangoJSONEncoder handles the rest."""
+    def encode(self, o):
+        return orjson.dumps(o, default=self.default).decode()
+
+
+class OrjsonDecoder(json.JSONDecoder):
+    """JSONField decoder backed by orjson."""
+    def decode(self, s, *args):
+        return orjson.loads(s)
+
+
+class ConsultationQuerySet(models.QuerySet):
+    def with_status(self):
+        """
+        Annotate status_label, Consultation.status computed in SQL, so
+        lists don't need the summary/diagnosis/management text to show it.
+        """
+        return self.annotate(status_label=Case(
+            When(is_reviewed=True, then=Value('Reviewed')),
+            When(
+                Q(summary__gt='') & Q(diagnosis__gt='') & Q(management__gt=''),
+                then=Value('Completed'),
+            ),
+            default=Value('Pending'),
+            output_field=CharField(),
+        ))
+    
+    def for_list(self):
+        """
+        Only what the dashboard and history lists render: short previews
+        of the case and diagnosis instead of the full text columns.
+        """
+        return self.only('id', 'language', 'is_reviewed', 'created_at').annotate(
+            case_preview=Left('clinical_case', 400),
+            diagnosis_preview=Left('diagnosis', 300),
+        ).with_status()
+    
+    def search(self, term):
+        """
+        Search the clinical case, diagnosis and management text.
+        On PostgreSQL this is a full-text query served by the GIN index
+        from migration 0005; other backends fall back to substring matches.
+        """
+        if connections[self.db].vendor == 'postgresql':
+            # Imported here: needs psycopg, which SQLite deployments lack
+            from django.contrib.postgres.search import SearchQuery, SearchVector
+
+            # Must match the indexed expression in migration 0005
+            vector = SearchVector('clinical_case', 'diagnosis', 'management', config='simple')
+            query = SearchQuery(term, config='simple', search_type='websearch')
+            return self.annotate(search=vector).filter(search=query)
+
+        return self.filter(
+            Q(clinical_case__icontains=term) |
+            Q(diagnosis__icontains=term) |
+            Q(management__icontains=term)
+        )
+
+
 class Consultation(models.Model):
     LANGUAGE_CHOICES = [
         ('en', 'English'),
@@ -207,11 +277,17 @@ class Consultation(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     is_reviewed = models.BooleanField(default=False)
     
+    objects = ConsultationQuerySet.as_manager()
+    
     class Meta:
         ordering = ['-created_at']
         indexes = [
-            models.Index(fields=['-created_at']),
             # Removed index on patient_name since the field was deleted
+            # Reviewed and pending lists, newest first
+            models.Index(fields=['is_reviewed', '-created_at']),
+            models.Index(fields=['language']),
+            # Covers the date-range + language GROUP BY in AnalyticsSnapshot.record
+            models.Index(fields=['created_at', 'language']),
         ]
     
     def __str__(self):
@@ -257,28 +333,75 @@ class SystemSettings(models.Model):
     def __str__(self):
         return f"System Settings (Updated: {self.updated_at.strftime('%Y-%m-%d %H:%M')})"
     
+    CACHE_KEY = 'system_settings'
+    CACHE_TIMEOUT = 60 * 60
+    
     def save(self, *args, **kwargs):
         self.pk = 1
         super().save(*args, **kwargs)
+        # Refresh the cached copy so load() never returns stale settings
+        cache.set(self.CACHE_KEY, self, self.CACHE_TIMEOUT)
     
     def delete(self, *args, **kwargs):
         pass
     
     @classmethod
     def load(cls):
-        obj, created = cls.objects.get_or_create(pk=1)
-        return obj
+        def fetch():
+            obj, created = cls.objects.get_or_create(pk=1)
+            return obj
+        return cache.get_or_set(cls.CACHE_KEY, fetch, cls.CACHE_TIMEOUT)
 
 
 class AnalyticsSnapshot(models.Model):
     """Daily analytics snapshots"""
     date = models.DateField(default=timezone.now, unique=True)
     total_consultations = models.IntegerField(default=0)
-    consultations_by_language = models.JSONField(default=dict)
+    consultations_by_language = models.JSONField(
+        default=dict, encoder=OrjsonEncoder, decoder=OrjsonDecoder
+    )
     
     class Meta:
         ordering = ['-date']
         indexes = [models.Index(fields=['-date'])]
     
     def __str__(self):
-        return f"Analytics for {self.date}"
\ No newline at end of file
+        return f"Analytics for {self.date}"
+    
+    @classmethod
+    def record(cls, start, end=None):
+        """
+        Build or refresh the snapshots for every day from start to end
+        (inclusive) using a single aggregated query.
+        """
+        end = end or start
+        # A half-open created_at range, so the (created_at, language) index
+        # covers the scan; created_at__date__range can't use it
+        rows = Consultation.objects.filter(
+            created_at__gte=timezone.make_aware(datetime.combine(start, time.min)),
+            created_at__lt=timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min)),
+        ).values_list('created_at__date', 'language').annotate(
+            count=Count('id')
+        ).order_by()
+        
+        by_day = defaultdict(dict)
+        for day, language, count in rows:
+            by_day[day][language] = count
+        
+        snapshots = []
+        for offset in range((end - start).days + 1):
+            day = start + timedelta(days=offset)
+            by_language = by_day.get(day, {})
+            snapshots.append(cls(
+                date=day,
+                total_consultations=sum(by_language.values()),
+                consultations_by_language=by_language,
+            ))
+        
+        return cls.objects.bulk_create(
+            snapshots,
+            batch_size=500,
+            update_conflicts=True,
+            unique_fields=['date'],
+            update_fields=['total_consultations', 'consultations_by_language'],
+        )
\ No newline at end of file
@@ -0,0 +1,145 @@
+"""
+ReportLab rendering for consultation reports. Imported on first use by
+consultations.utils, so requests that never build a PDF don't load ReportLab.
+"""
+import copy
+from io import BytesIO
+from django.conf import settings
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import inch
+from reportlab.lib.enums import TA_CENTER, TA_LEFT
+
+
+# Styles are identical for every report, so build them once per process
+_STYLES = getSampleStyleSheet()
+
+_BRAND = colors.HexColor('#667eea')
+_META_BG = colors.HexColor('#f3f4f6')
+
+_TITLE_STYLE = ParagraphStyle(
+    'CustomTitle',
+    parent=_STYLES['Heading1'],
+    fontSize=24,
+    textColor=_BRAND,
+    spaceAfter=30,
+    alignment=TA_CENTER
+)
+
+_HEADING_STYLE = ParagraphStyle(
+    'CustomHeading',
+    parent=_STYLES['Heading2'],
+    fontSize=14,
+    textColor=_BRAND,
+    spaceAfter=12,
+    spaceBefore=20
+)
+
+# A copy, rather than changing the shared sample 'Normal' style in place
+_NORMAL_STYLE = ParagraphStyle(
+    'CustomNormal',
+    parent=_STYLES['Normal'],
+    fontSize=10,
+    leading=14
+)
+
+_DISCLAIMER_STYLE = ParagraphStyle(
+    'Disclaimer',
+    parent=_NORMAL_STYLE,
+    fontSize=8,
+    textColor=colors.grey,
+    alignment=TA_CENTER
+)
+
+_META_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (0, -1), _META_BG),
+    ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
+    ('ALIGN', (0, 0), (0, -1), 'RIGHT'),
+    ('ALIGN', (1, 0), (1, -1), 'LEFT'),
+    ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+    ('FONTNAME', (1, 0), (1, -1), 'Helvetica'),
+    ('FONTSIZE', (0, 0), (-1, -1), 10),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
+    ('TOPPADDING', (0, 0), (-1, -1), 8),
+    ('GRID', (0, 0), (-1, -1), 1, colors.grey),
+])
+
+_META_LABELS = ('Consultation ID:', 'Date:', 'Language:', 'Status:')
+
+_DISCLAIMER = """
+    <b>Clinical Disclaimer:</b> This consultation record was generated with AI assistance. 
+    All clinical decisions should be made by qualified healthcare professionals based on their 
+    professional judgment, patient assessment, and current clinical guidelines. This tool is 
+    designed to support, not replace, clinical expertise.
+    """
+
+# Parsed once. Layout state (blPara) is only set on the per-report copies,
+# never on this prototype, so a shallow copy is as good as a fresh parse.
+_DISCLAIMER_PARAGRAPH = Paragraph(_DISCLAIMER, _DISCLAIMER_STYLE)
+
+
+def _section(title, text):
+    """
+    Heading, body paragraph and trailing spacer for one report section
+    """
+    # Replace newlines with <br/> for PDF rendering
+    return [
+        Paragraph(title, _HEADING_STYLE),
+        Paragraph(text.replace('\n', '<br/>'), _NORMAL_STYLE),
+        Spacer(1, 0.2*inch),
+    ]
+
+
+def render_pdf_report(consultation):
+    """
+    Render the PDF for a ReportData
+    """
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter, 
+                            topMargin=0.5*inch, bottomMargin=0.5*inch,
+                            leftMargin=0.75*inch, rightMargin=0.75*inch,
+                            pageCompression=int(getattr(settings, 'PDF_COMPRESS', True)))
+    
+    # Consultation Metadata Table (Replaces Patient Info)
+    created = consultation.created_at.strftime('%B %d, %Y - %I:%M %p')
+    status = 'Reviewed' if consultation.is_reviewed else 'Pending Review'
+    values = (f"#{consultation.pk}", created, consultation.language_display, status)
+    meta_data = list(zip(_META_LABELS, values))
+    
+    meta_table = Table(meta_data, colWidths=[2*inch, 4*inch])
+    meta_table.setStyle(_META_TABLE_STYLE)
+    
+    # Container for PDF elements: the fixed head of the report in one go
+    elements = [
+        # Title
+        Paragraph("MedInsight Consultation Report", _TITLE_STYLE),
+        Spacer(1, 0.2*inch),
+        meta_table,
+        Spacer(1, 0.3*inch),
+        # Clinical Case Narrative (The single input field)
+        *_section("Clinical Case Narrative", consultation.clinical_case),
+        # Page break before AI analysis to keep it clean
+        PageBreak(),
+    ]
+    
+    # Clinical Summary, Diagnosis and Management, when present
+    for title, text in (
+        ("Clinical Summary", consultation.summary),
+        ("Diagnosis", consultation.diagnosis),
+        ("Management Plan", consultation.management),
+    ):
+        if text:
+            elements.extend(_section(title, text))
+    
+    # Footer/Disclaimer
+    elements.append(Spacer(1, 0.5*inch))
+    elements.append(copy.copy(_DISCLAIMER_PARAGRAPH))
+    
+    # Build PDF
+    doc.build(elements)
+    
+    # Hand back the buffer itself; getvalue() would copy the whole PDF
+    buffer.seek(0)
+    return buffer
\ No newline at end of file
@@ -1,8 +1,13 @@
+import asyncio
 import os
-import re
 import json
+import time
+import weakref
 from django.conf import settings
-from huggingface_hub import InferenceClient
+from huggingface_hub import AsyncInferenceClient
+
+from .utils import parse_sections
+
 
 class LLMService:
     """
@@ -10,6 +15,15 @@ class LLMService:
     Refactored to support the single 'clinical_case' input field.
     """
     
+    # Stream flushing: at most this many tokens or seconds per chunk
+    flush_tokens = 16
+    flush_interval = 0.03
+    
+    # One client per event loop, reused across requests: its httpx
+    # connection pool belongs to the loop that opened it. Under uvicorn
+    # that is one client per worker, closed at lifespan shutdown.
+    _clients = weakref.WeakKeyDictionary()
+    
     def __init__(self):
         # 1. Get Token: Try environment variable first, then Django settings
         self.api_token = os.environ.get("HF_TOKEN") or getattr(settings, 'HF_API_TOKEN', None)
@@ -17,12 +31,23 @@ class LLMService:
         # 2. Your specific model repo on Hugging Face
         self.repo_id = "Nossim/my-t5-finetuned"
         
-        if self.api_token:
-            self.client = InferenceClient(model=self.repo_id, token=self.api_token)
-        else:
-            self.client = None
+        if not self.api_token:
             print("Warning: HF_TOKEN not found. LLMService will fail if called.")
 
+    def _get_client(self):
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            client = self._clients[loop] = AsyncInferenceClient(model=self.repo_id, token=self.api_token)
+        return client
+
+    @classmethod
+    async def aclose_client(cls):
+        """Close the running event loop's client, if one was opened."""
+        client = cls._clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.close()
+
     def create_prompt(self, consultation):
         """
         Create the prompt using the single clinical case text.
@@ -30,87 +55,50 @@ class LLMService:
         # T5 models usually work best with a simple prefix
         return f"summarize: {consultation.clinical_case}"
 
-    def stream_response(self, consultation):
+    async def astream_response(self, consultation):
         """
-        Stream the LLM response in real-time.
+        Stream the LLM response in real-time for the ASGI view.
         Yields text chunks for the frontend and saves the final result to DB.
+        Tokens are awaited on the event loop instead of holding a thread
+        per stream, over the loop's shared client (see _get_client).
         """
-        if not self.client:
-            yield 'data: {"type": "error", "message": "Server Config Error: HF_TOKEN missing"}\n\n'
-            return
+        if not self.api_token:
+            raise Exception("Server Config Error: HF_TOKEN missing")
 
         prompt = self.create_prompt(consultation)
-        full_response = ""
+        parts = []
+        # Coalesce tokens so each SSE frame carries several of them; at
+        # slow token rates every token still goes out as it arrives
+        buffer = []
+        last_flush = time.monotonic()
 
         try:
-            # Call HF API with streaming
-            stream = self.client.text_generation(
-                prompt, 
-                max_new_tokens=512, 
+            client = self._get_client()
+            stream = await client.text_generation(
+                prompt,
+                max_new_tokens=512,
                 stream=True
             )
 
-            for token in stream:
-                # Handle different token formats (string vs object)
+            async for token in stream:
                 content = token if isinstance(token, str) else token.token.text
-                
-                # Yield pure text content for the view to wrap in JSON
-                yield content
-                full_response += content
+                parts.append(content)
+                buffer.append(content)
+                if (len(buffer) >= self.flush_tokens
+                        or time.monotonic() - last_flush > self.flush_interval):
+                    yield ''.join(buffer)
+                    buffer.clear()
+                    last_flush = time.monotonic()
+
+            if buffer:
+                yield ''.join(buffer)
+
+            parsed_data = parse_sections("".join(parts))
 
-            # After streaming is done, parse and save to Database
-            parsed_data = self._parse_response(full_response)
-            
             consultation.summary = parsed_data['summary']
             consultation.diagnosis = parsed_data['diagnosis']
             consultation.management = parsed_data['management']
-            consultation.save()
+            await consultation.asave(update_fields=['summary', 'diagnosis', 'management', 'updated_at'])
 
         except Exception as e:
-            # Propagate error string
             raise Exception(f"HF API Error: {str(e)}")
-
-    def _parse_response(self, text):
-        """
-        Parse the raw model output text using Regex.
-        Matches: 'Summary: ... Diagnosis: ... Management: ...'
-        """
-        text = text.strip()
-        
-        summary = ""
-        diagnosis = ""
-        management = ""
-
-        # Case-insensitive Regex search
-        diag_match = re.search(r'diagnosis[:\s]+', text, re.IGNORECASE)
-        mgmt_match = re.search(r'management[:\s]+', text, re.IGNORECASE)
-
-        if diag_match and mgmt_match:
-            # 1. Summary (Start -> Diagnosis)
-            summary_end = diag_match.start()
-            summary = text[:summary_end].replace("Summary:", "").strip()
-            
-            # 2. Diagnosis (Diagnosis -> Management)
-            diag_start = diag_match.end()
-            diag_end = mgmt_match.start()
-            diagnosis = text[diag_start:diag_end].strip()
-            
-            # 3. Management (Management -> End)
-            mgmt_start = mgmt_match.end()
-            management = text[mgmt_start:].strip()
-            
-        elif diag_match:
-            # Fallback: Diagnosis found, but no Management
-            summary_end = diag_match.start()
-            summary = text[:summary_end].replace("Summary:", "").strip()
-            diagnosis = text[diag_match.end():].strip()
-            
-        else:
-            # Fallback: No keywords found, treat whole text as summary
-            summary = text
-
-        return {
-            "summary": summary,
-            "diagnosis": diagnosis,
-            "management": management
-        }
\ No newline at end of file
@@ -0,0 +1,43 @@
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import AnalyticsSnapshot, Consultation
+
+# Cached page statistics (see views.home / dashboard / analytics)
+HOME_STATS_KEY = 'home:stats'
+DASHBOARD_STATS_KEY = 'dashboard:stats'
+ANALYTICS_STATS_KEY = 'analytics:stats'
+
+# Part of every cached history count key; bumping it orphans them all
+HISTORY_COUNT_VERSION_KEY = 'history:count:version'
+
+
+def history_count_version():
+    return cache.get_or_set(HISTORY_COUNT_VERSION_KEY, 1, None)
+
+
+def invalidate_consultation_caches():
+    """
+    Drop the cached statistics and history counts. Called on every save and
+    delete; bulk writers (queryset.update(), bulk_create()) send no signals
+    and should call it themselves.
+    """
+    cache.delete_many([HOME_STATS_KEY, DASHBOARD_STATS_KEY, ANALYTICS_STATS_KEY])
+    try:
+        cache.incr(HISTORY_COUNT_VERSION_KEY)
+    except ValueError:
+        # Not set yet (or evicted): nothing cached against it
+        pass
+
+
+@receiver([post_save, post_delete], sender=Consultation)
+def invalidate_stats(sender, **kwargs):
+    invalidate_consultation_caches()
+
+    # Snapshots of finished days are treated as final. Drop the one this
+    # consultation counted towards; the analytics page re-records it.
+    day = timezone.localdate(kwargs['instance'].created_at)
+    if day < timezone.localdate():
+        AnalyticsSnapshot.objects.filter(date=day).delete()
@@ -1,3 +1,446 @@
-from django.test import TestCase
+import csv
+import io
+import os
+import tempfile
+from datetime import datetime, time, timedelta
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import iscoroutinefunction
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .middleware import QueryCountMiddleware
+from .ml_service import MLService
+from .models import AnalyticsSnapshot, Consultation
+from .services import LLMService
+from .signals import history_count_version
+from .utils import parse_sections
+from .views import get_inference_service, get_llm_service
+
+
+class AdminChangelistTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'pw')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.admin)
+
+    def get_changelist(self, rows):
+        Consultation.objects.bulk_create(
+            Consultation(clinical_case=f"case {i}", diagnosis="flu") for i in range(rows)
+        )
+        with self.assertNumQueries(8):
+            response = self.client.get(reverse('admin:consultations_consultation_changelist'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_query_count_does_not_grow_with_rows(self):
+        # Session, user, two counts, the SystemSettings add-permission check
+        # in the sidebar, the rows, and two date-hierarchy queries; none per row
+        self.get_changelist(5)
+        self.get_changelist(45)
+
+    def run_action(self, action, consultations):
+        return self.client.post(reverse('admin:consultations_consultation_changelist'), {
+            'action': action,
+            '_selected_action': [c.pk for c in consultations],
+        })
+
+    def test_review_actions_refresh_the_cached_dashboard_counts(self):
+        consultations = [Consultation.objects.create(clinical_case=f"case {i}") for i in range(3)]
+        self.assertEqual(self.client.get(reverse('dashboard')).context['reviewed_count'], 0)
+
+        self.run_action('mark_as_reviewed', consultations[:2])
+        self.assertEqual(self.client.get(reverse('dashboard')).context['reviewed_count'], 2)
+
+        self.run_action('mark_as_pending', consultations[:1])
+        self.assertEqual(self.client.get(reverse('dashboard')).context['reviewed_count'], 1)
+
+
+class ParseSectionsTests(SimpleTestCase):
+    def test_all_sections(self):
+        self.assertEqual(
+            parse_sections("Summary: Fever for 3 days. Diagnosis: Malaria Management: ACT, fluids"),
+            {'summary': 'Fever for 3 days.', 'diagnosis': 'Malaria', 'management': 'ACT, fluids'},
+        )
+
+    def test_markers_are_case_insensitive(self):
+        parsed = parse_sections("summary: cough DIAGNOSIS: TB management: refer")
+        self.assertEqual(parsed, {'summary': 'cough', 'diagnosis': 'TB', 'management': 'refer'})
+
+    def test_no_markers_is_all_summary(self):
+        self.assertEqual(
+            parse_sections("  Patient stable.  "),
+            {'summary': 'Patient stable.', 'diagnosis': '', 'management': ''},
+        )
+
+    def test_repeated_marker_stays_in_its_section(self):
+        parsed = parse_sections("Diagnosis: flu, diagnosis: confirmed Management: rest")
+        self.assertEqual(parsed['diagnosis'], 'flu, diagnosis: confirmed')
+        self.assertEqual(parsed['management'], 'rest')
+
+    def test_summary_prefix_only_stripped_at_start(self):
+        parsed = parse_sections("Summary: see Summary: above")
+        self.assertEqual(parsed['summary'], 'see Summary: above')
+
+
+class HistoryPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Consultation.objects.bulk_create(Consultation(clinical_case=f"case {i}") for i in range(45))
+        # Several rows share a timestamp, so the pk tiebreak matters
+        same = timezone.now() - timedelta(days=1)
+        Consultation.objects.filter(pk__in=Consultation.objects.order_by('pk').values('pk')[10:30]).update(created_at=same)
+
+    def setUp(self):
+        cache.clear()
+
+    def page_pks(self, response):
+        return [c.pk for c in response.context['page_obj']]
+
+    def test_cursor_pages_match_offset_pages(self):
+        url = reverse('consultation_history')
+        offset_pks = []
+        for page in (1, 2, 3):
+            offset_pks += self.page_pks(self.client.get(url, {'page': page}))
+
+        response = self.client.get(url)
+        cursor_pks = self.page_pks(response)
+        page = 1
+        while response.context['next_cursor']:
+            page += 1
+            response = self.client.get(url, {'page': page, 'after': response.context['next_cursor']})
+            self.assertEqual(response.context['page_obj'].number, page)
+            cursor_pks += self.page_pks(response)
+
+        self.assertEqual(page, 3)
+        self.assertEqual(cursor_pks, offset_pks)
+        self.assertEqual(sorted(cursor_pks), sorted(Consultation.objects.values_list('pk', flat=True)))
+
+    def test_bad_cursor_falls_back_to_offset(self):
+        url = reverse('consultation_history')
+        expected = self.page_pks(self.client.get(url, {'page': 2}))
+        response = self.client.get(url, {'page': 2, 'after': 'not-a-cursor'})
+        self.assertEqual(self.page_pks(response), expected)
+
+
+class ExportCsvTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Consultation.objects.bulk_create(
+            [Consultation(clinical_case="c", language='en', diagnosis="flu") for _ in range(3)]
+            + [Consultation(clinical_case="c", language='sw', diagnosis="homa") for _ in range(2)]
+        )
+
+    async def test_streams_filtered_rows(self):
+        response = await self.async_client.get(reverse('export_consultations_csv'), {'language': 'sw'})
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        # An async iterator, so ASGI streams it instead of building a list
+        self.assertTrue(response.is_async)
+        body = b''.join([part async for part in response.streaming_content]).decode()
+        rows = list(csv.reader(io.StringIO(body)))
+        self.assertEqual(rows[0], ['id', 'created_at', 'language', 'reviewed', 'summary', 'diagnosis', 'management'])
+        self.assertEqual(len(rows), 3)
+        self.assertEqual({row[2] for row in rows[1:]}, {'sw'})
+        self.assertEqual({row[5] for row in rows[1:]}, {'homa'})
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.consultation = Consultation.objects.create(clinical_case="case", diagnosis="flu")
+        self.url = reverse('consultation_detail', args=[self.consultation.pk])
+
+    def test_detail_not_modified(self):
+        etag = self.client.get(self.url)['ETag']
+        self.assertEqual(self.client.get(self.url, headers={'if-none-match': etag}).status_code, 304)
+
+    def test_detail_etag_changes_on_save_and_review(self):
+        etag = self.client.get(self.url)['ETag']
+        self.consultation.save()
+        response = self.client.get(self.url, headers={'if-none-match': etag})
+        self.assertEqual(response.status_code, 200)
+
+        # The admin review actions use update(), which keeps updated_at
+        etag = response['ETag']
+        Consultation.objects.filter(pk=self.consultation.pk).update(is_reviewed=True)
+        self.assertEqual(self.client.get(self.url, headers={'if-none-match': etag}).status_code, 200)
+
+    def test_detail_with_pending_message_is_not_304(self):
+        etag = self.client.get(self.url)['ETag']
+        other = Consultation.objects.create(clinical_case="other")
+        self.client.post(reverse('consultation_delete', args=[other.pk]))
+        response = self.client.get(self.url, headers={'if-none-match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'deleted successfully')
+
+    def test_analytics_etag_follows_cached_stats(self):
+        url = reverse('analytics')
+        # Nothing cached yet, so nothing cheap to compare against
+        self.assertFalse(self.client.get(url).has_header('ETag'))
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, headers={'if-none-match': etag}).status_code, 304)
+
+        Consultation.objects.create(clinical_case="new")
+        self.assertEqual(self.client.get(url, headers={'if-none-match': etag}).status_code, 200)
+
+
+class RecordAnalyticsTests(TestCase):
+    def create_on(self, day, language, count=1):
+        created = Consultation.objects.bulk_create(
+            Consultation(clinical_case="c", language=language) for _ in range(count)
+        )
+        at = timezone.make_aware(datetime.combine(day, time(12)))
+        Consultation.objects.filter(pk__in=[c.pk for c in created]).update(created_at=at)
+
+    def test_records_finished_days_only(self):
+        today = timezone.localdate()
+        self.create_on(today - timedelta(days=2), 'en', 2)
+        self.create_on(today - timedelta(days=2), 'sw')
+        self.create_on(today, 'en')
+
+        call_command('record_analytics', days=3, stdout=io.StringIO())
+
+        snapshots = {s.date: s for s in AnalyticsSnapshot.objects.all()}
+        self.assertEqual(sorted(snapshots), [today - timedelta(days=n) for n in (3, 2, 1)])
+        two_days_ago = snapshots[today - timedelta(days=2)]
+        self.assertEqual(two_days_ago.total_consultations, 3)
+        self.assertEqual(two_days_ago.consultations_by_language, {'en': 2, 'sw': 1})
+        self.assertEqual(snapshots[today - timedelta(days=1)].total_consultations, 0)
+
+    def test_rerun_refreshes_rows(self):
+        yesterday = timezone.localdate() - timedelta(days=1)
+        call_command('record_analytics', stdout=io.StringIO())
+        self.create_on(yesterday, 'en')
+        call_command('record_analytics', stdout=io.StringIO())
+        self.assertEqual(AnalyticsSnapshot.objects.get(date=yesterday).total_consultations, 1)
+
+
+class SnapshotInvalidationTests(TestCase):
+    def test_deleting_a_past_consultation_drops_its_snapshot(self):
+        yesterday = timezone.localdate() - timedelta(days=1)
+        consultation = Consultation.objects.create(clinical_case="c")
+        Consultation.objects.filter(pk=consultation.pk).update(
+            created_at=timezone.make_aware(datetime.combine(yesterday, time(12)))
+        )
+        AnalyticsSnapshot.record(yesterday)
+        AnalyticsSnapshot.record(yesterday - timedelta(days=1))
+
+        Consultation.objects.get(pk=consultation.pk).delete()
+
+        self.assertFalse(AnalyticsSnapshot.objects.filter(date=yesterday).exists())
+        self.assertTrue(AnalyticsSnapshot.objects.filter(date=yesterday - timedelta(days=1)).exists())
+
+    def test_todays_consultations_leave_snapshots_alone(self):
+        yesterday = timezone.localdate() - timedelta(days=1)
+        AnalyticsSnapshot.record(yesterday)
+        Consultation.objects.create(clinical_case="c").delete()
+        self.assertTrue(AnalyticsSnapshot.objects.filter(date=yesterday).exists())
+
+
+class ImportConsultationsTests(TestCase):
+    def import_csv(self, content):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False, encoding='utf-8') as f:
+            f.write(content)
+        self.addCleanup(os.remove, f.name)
+        call_command('import_consultations', f.name, batch_size=2, stdout=io.StringIO())
+
+    def test_imports_in_batches(self):
+        self.import_csv("clinical_case,language,diagnosis\ncase 1,sw,homa\ncase 2,,\ncase 3,en,flu\n")
+        self.assertEqual(
+            list(Consultation.objects.order_by('pk').values_list('clinical_case', 'language', 'diagnosis')),
+            [('case 1', 'sw', 'homa'), ('case 2', 'en', None), ('case 3', 'en', 'flu')],
+        )
+
+    def test_invalid_row_aborts_with_its_line(self):
+        for content, message in (
+            ("clinical_case,language\nok,en\nbad,zz\n", "Line 3: language"),
+            ("clinical_case,language\nok,en\n,en\n", "Line 3: clinical_case"),
+        ):
+            with self.subTest(message=message):
+                with self.assertRaisesMessage(CommandError, message):
+                    self.import_csv(content)
+                self.assertFalse(Consultation.objects.exists())
+
+    def test_missing_column(self):
+        with self.assertRaisesMessage(CommandError, "clinical_case column"):
+            self.import_csv("diagnosis\nflu\n")
+
+    def test_drops_cached_counts(self):
+        version = history_count_version()
+        self.import_csv("clinical_case\ncase\n")
+        self.assertNotEqual(history_count_version(), version)
+
+
+class DeleteConsultationTests(TestCase):
+    def test_post_deletes_without_loading_text_columns(self):
+        consultation = Consultation.objects.create(clinical_case="long text " * 100)
+        url = reverse('consultation_delete', args=[consultation.pk])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url)
+        self.assertRedirects(response, reverse('consultation_history'), fetch_redirect_response=False)
+        self.assertFalse(Consultation.objects.filter(pk=consultation.pk).exists())
+        selects = [q['sql'] for q in queries if q['sql'].startswith('SELECT') and 'consultations_consultation' in q['sql']]
+        self.assertEqual(len(selects), 1)
+        self.assertNotIn('clinical_case', selects[0])
+
+    def test_missing_consultation_is_404(self):
+        self.assertEqual(self.client.post(reverse('consultation_delete', args=[999])).status_code, 404)
+
+    def test_get_redirects_without_deleting(self):
+        consultation = Consultation.objects.create(clinical_case="c")
+        response = self.client.get(reverse('consultation_delete', args=[consultation.pk]))
+        self.assertRedirects(
+            response, reverse('consultation_detail', args=[consultation.pk]), fetch_redirect_response=False
+        )
+        self.assertTrue(Consultation.objects.filter(pk=consultation.pk).exists())
+
+
+class LegacyFieldsMigrationTests(TransactionTestCase):
+    migrate_from = ('consultations', '0003_rename_api_key_systemsettings_model_path_and_more')
+    migrate_to = ('consultations', '0004_remove_consultation_consultatio_patient_05eea1_idx_and_more')
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_legacy_fields_are_copied_into_clinical_case(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate([self.migrate_from])
+        apps = executor.loader.project_state([self.migrate_from]).apps
+        Legacy = apps.get_model('consultations', 'Consultation')
+        legacy = Legacy.objects.create(
+            patient_name='Jane', patient_age=34, patient_gender='F',
+            chief_complaint='Cough', symptoms_description='Dry cough at night',
+            duration='2 weeks', vital_signs=None, medical_history='Asthma',
+        )
+
+        executor = MigrationExecutor(connection)
+        executor.migrate([self.migrate_to])
+        apps = executor.loader.project_state([self.migrate_to]).apps
+        migrated = apps.get_model('consultations', 'Consultation').objects.get(pk=legacy.pk)
+
+        self.assertEqual(migrated.clinical_case, (
+            "Patient: Jane\nAge: 34\nGender: Female\nChief complaint: Cough\n"
+            "Symptoms: Dry cough at night\nDuration: 2 weeks\nMedical history: Asthma"
+        ))
+
+
+class SettingsPageTests(TestCase):
+    def test_shows_the_local_model_precision(self):
+        with mock.patch.object(MLService, '_model', object()), \
+                mock.patch.object(MLService, 'precision', 'int8'):
+            response = self.client.get(reverse('settings'))
+        self.assertContains(response, '<p class="font-semibold text-gray-900" id="modelPrecision">int8</p>', html=True)
+
+    def test_remote_backend_has_no_precision(self):
+        response = self.client.get(reverse('settings'))
+        self.assertContains(response, '<p class="font-semibold text-gray-900" id="modelPrecision">N/A</p>', html=True)
+
+
+class StreamResponseTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    async def stream(self, consultation):
+        response = await self.async_client.get(reverse('stream_ai_response', args=[consultation.pk]))
+        return b''.join([chunk async for chunk in response.streaming_content]).decode()
+
+    async def test_local_model_stream_saves_the_parsed_sections(self):
+        consultation = await Consultation.objects.acreate(clinical_case="Fever for three days")
+        chunks = ["Summary: fever. ", "Diagnosis: malaria. ", "Management: artemether."]
+
+        with mock.patch.object(MLService, '_model', object()), \
+                mock.patch.object(MLService, '_load_attempted', True), \
+                mock.patch.object(MLService, '_stream_generate', return_value=iter(chunks)) as generate:
+            body = await self.stream(consultation)
+            # The second request is served from the cache
+            await self.stream(consultation)
+
+        self.assertEqual(generate.call_count, 1)
+        self.assertIn('"type":"complete"', body.replace(' ', ''))
+        await consultation.arefresh_from_db()
+        self.assertEqual(consultation.diagnosis, "malaria.")
+        self.assertEqual(consultation.management, "artemether.")
+
+
+@mock.patch.dict(os.environ, {'HF_TOKEN': 'hf_test'})
+class InferenceClientTests(SimpleTestCase):
+    def setUp(self):
+        get_llm_service.cache_clear()
+
+    @mock.patch.object(MLService, '_load_attempted', True)
+    def test_fallback_service_is_reused_across_requests(self):
+        service = get_inference_service()
+        self.assertIsInstance(service, LLMService)
+        self.assertIs(get_inference_service(), service)
+
+    async def test_client_is_shared_per_loop_and_closed_at_shutdown(self):
+        from medInsight.asgi import application
+
+        client = LLMService()._get_client()
+        self.assertIs(LLMService()._get_client(), client)
+
+        messages = iter([{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}])
+        sent = []
+
+        async def receive():
+            return next(messages)
+
+        async def send(message):
+            sent.append(message['type'])
+
+        with mock.patch.object(client, 'close') as close:
+            await application({'type': 'lifespan'}, receive, send)
+
+        close.assert_awaited_once()
+        self.assertEqual(sent, ['lifespan.startup.complete', 'lifespan.shutdown.complete'])
+        self.assertIsNot(LLMService()._get_client(), client)
+
+
+# connection.queries is only recorded while DEBUG is on
+@override_settings(DEBUG=True, QUERY_COUNT_WARNING=2)
+class QueryCountMiddlewareTests(TestCase):
+    def setUp(self):
+        self.request = RequestFactory().get('/history/')
+
+    def test_warns_about_a_sync_view_over_the_threshold(self):
+        def view(request):
+            for _ in range(3):
+                Consultation.objects.count()
+            return HttpResponse()
+
+        with self.assertLogs('consultations.middleware', 'WARNING') as logs:
+            QueryCountMiddleware(view)(self.request)
+        self.assertIn('ran 3 queries', logs.output[0])
+
+    async def test_counts_async_orm_calls(self):
+        async def view(request):
+            for _ in range(3):
+                await Consultation.objects.acount()
+            return HttpResponse()
+
+        middleware = QueryCountMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        with self.assertLogs('consultations.middleware', 'WARNING') as logs:
+            await middleware(self.request)
+        self.assertIn('ran 3 queries', logs.output[0])
+
+    def test_skips_streaming_responses(self):
+        def view(request):
+            for _ in range(3):
+                Consultation.objects.count()
+            return StreamingHttpResponse(iter([b'']))
+
+        with self.assertNoLogs('consultations.middleware', 'WARNING'):
+            QueryCountMiddleware(view)(self.request)
@@ -21,6 +21,7 @@ urlpatterns = [
     
     # History
     path('consultations/', views.consultation_history, name='consultation_history'),
+    path('consultations/export/', views.export_consultations_csv, name='export_consultations_csv'),
     
     # Analytics
     path('analytics/', views.analytics, name='analytics'),
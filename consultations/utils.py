@@ -1,131 +1,132 @@
-from io import BytesIO
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-from reportlab.lib.enums import TA_CENTER, TA_LEFT
+import os
+import re
+import glob
+import tempfile
+from dataclasses import dataclass
 from datetime import datetime
 
+from django.conf import settings
+
+# Section markers in the model output, compiled once
+_SECTION_RE = re.compile(r'(diagnosis|management)[:\s]+', re.IGNORECASE)
+_SUMMARY_STRIP_RE = re.compile(r'^\s*summary\s*:\s*', re.IGNORECASE)
+
+
+def parse_sections(text):
+    """
+    Split raw model output into summary, diagnosis and management.
+    Expects format like: "Summary: ... Diagnosis: ... Management: ..."
+    """
+    text = text.strip()
+
+    # One regex pass finds every marker; each section runs from the end
+    # of its marker to the start of the next new one. Text before the
+    # first marker (or all of it, if there are none) is the summary.
+    sections = {}
+    current, start = 'summary', 0
+    for match in _SECTION_RE.finditer(text):
+        key = match.group(1).lower()
+        if key == current or key in sections:
+            continue
+        sections[current] = text[start:match.start()]
+        current, start = key, match.end()
+    sections[current] = text[start:]
+
+    return {
+        "summary": _SUMMARY_STRIP_RE.sub("", sections['summary']).strip(),
+        "diagnosis": sections.get('diagnosis', "").strip(),
+        "management": sections.get('management', "").strip(),
+    }
+
+
+@dataclass(frozen=True)
+class ReportData:
+    """
+    The consultation fields a report needs, as a plain object detached
+    from the ORM.
+    """
+    pk: int
+    created_at: datetime
+    language_display: str
+    is_reviewed: bool
+    clinical_case: str
+    summary: str
+    diagnosis: str
+    management: str
+
+    @classmethod
+    def from_consultation(cls, consultation):
+        return cls(
+            pk=consultation.pk,
+            created_at=consultation.created_at,
+            language_display=consultation.get_language_display(),
+            is_reviewed=consultation.is_reviewed,
+            clinical_case=consultation.clinical_case,
+            summary=consultation.summary or '',
+            diagnosis=consultation.diagnosis or '',
+            management=consultation.management or '',
+        )
+
+
+def consultation_version(updated_at, is_reviewed):
+    """
+    Changes whenever the consultation does. Any save() changes updated_at;
+    is_reviewed is included because the admin review actions use
+    queryset.update(), which leaves updated_at alone.
+    """
+    return f"{updated_at:%Y%m%d%H%M%S%f}-{int(is_reviewed)}"
+
 
 def generate_pdf_report(consultation):
     """
-    Generate a PDF report for a consultation
+    Generate a PDF report for a consultation, as a BytesIO positioned at 0
     """
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter, 
-                            topMargin=0.5*inch, bottomMargin=0.5*inch,
-                            leftMargin=0.75*inch, rightMargin=0.75*inch)
-    
-    # Container for PDF elements
-    elements = []
-    
-    # Styles
-    styles = getSampleStyleSheet()
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=24,
-        textColor=colors.HexColor('#667eea'),
-        spaceAfter=30,
-        alignment=TA_CENTER
-    )
-    
-    heading_style = ParagraphStyle(
-        'CustomHeading',
-        parent=styles['Heading2'],
-        fontSize=14,
-        textColor=colors.HexColor('#667eea'),
-        spaceAfter=12,
-        spaceBefore=20
-    )
-    
-    normal_style = styles['Normal']
-    normal_style.fontSize = 10
-    normal_style.leading = 14
-    
-    # Title
-    elements.append(Paragraph("MedInsight Consultation Report", title_style))
-    elements.append(Spacer(1, 0.2*inch))
-    
-    # Consultation Metadata Table (Replaces Patient Info)
-    meta_data = [
-        ['Consultation ID:', f"#{consultation.pk}"],
-        ['Date:', consultation.created_at.strftime('%B %d, %Y - %I:%M %p')],
-        ['Language:', consultation.get_language_display()],
-        ['Status:', 'Reviewed' if consultation.is_reviewed else 'Pending Review']
-    ]
-    
-    meta_table = Table(meta_data, colWidths=[2*inch, 4*inch])
-    meta_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#f3f4f6')),
-        ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
-        ('ALIGN', (0, 0), (0, -1), 'RIGHT'),
-        ('ALIGN', (1, 0), (1, -1), 'LEFT'),
-        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-        ('FONTNAME', (1, 0), (1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
-        ('TOPPADDING', (0, 0), (-1, -1), 8),
-        ('GRID', (0, 0), (-1, -1), 1, colors.grey),
-    ]))
-    
-    elements.append(meta_table)
-    elements.append(Spacer(1, 0.3*inch))
-    
-    # Clinical Case Narrative (The single input field)
-    elements.append(Paragraph("Clinical Case Narrative", heading_style))
-    # Replace newlines with <br/> for PDF rendering
-    case_text = consultation.clinical_case.replace('\n', '<br/>')
-    elements.append(Paragraph(case_text, normal_style))
-    elements.append(Spacer(1, 0.2*inch))
-    
-    # Page break before AI analysis to keep it clean
-    elements.append(PageBreak())
-    
-    # Clinical Summary
-    if consultation.summary:
-        elements.append(Paragraph("Clinical Summary", heading_style))
-        summary_text = consultation.summary.replace('\n', '<br/>')
-        elements.append(Paragraph(summary_text, normal_style))
-        elements.append(Spacer(1, 0.2*inch))
-    
-    # Diagnosis
-    if consultation.diagnosis:
-        elements.append(Paragraph("Diagnosis", heading_style))
-        diagnosis_text = consultation.diagnosis.replace('\n', '<br/>')
-        elements.append(Paragraph(diagnosis_text, normal_style))
-        elements.append(Spacer(1, 0.2*inch))
-    
-    # Management
-    if consultation.management:
-        elements.append(Paragraph("Management Plan", heading_style))
-        management_text = consultation.management.replace('\n', '<br/>')
-        elements.append(Paragraph(management_text, normal_style))
-        elements.append(Spacer(1, 0.2*inch))
-    
-    # Footer/Disclaimer
-    elements.append(Spacer(1, 0.5*inch))
-    disclaimer_style = ParagraphStyle(
-        'Disclaimer',
-        parent=styles['Normal'],
-        fontSize=8,
-        textColor=colors.grey,
-        alignment=TA_CENTER
-    )
-    disclaimer = """
-    <b>Clinical Disclaimer:</b> This consultation record was generated with AI assistance. 
-    All clinical decisions should be made by qualified healthcare professionals based on their 
-    professional judgment, patient assessment, and current clinical guidelines. This tool is 
-    designed to support, not replace, clinical expertise.
+    # ReportLab is only imported once a report is actually requested
+    from .pdf import render_pdf_report
+    return render_pdf_report(ReportData.from_consultation(consultation))
+
+
+def cached_pdf_report(consultation):
+    """
+    Path of the consultation's rendered PDF, rendering it first if there
+    is no file for its current version; the file name doubles as the
+    invalidation key.
     """
-    elements.append(Paragraph(disclaimer, disclaimer_style))
-    
-    # Build PDF
-    doc.build(elements)
-    
-    # Get PDF from buffer
-    pdf = buffer.getvalue()
-    buffer.close()
-    
-    return pdf
\ No newline at end of file
+    cache_dir = settings.PDF_CACHE_DIR
+    version = consultation_version(consultation.updated_at, consultation.is_reviewed)
+    path = os.path.join(cache_dir, f"{consultation.pk}-{version}.pdf")
+    if os.path.exists(path):
+        return path
+
+    os.makedirs(cache_dir, exist_ok=True)
+    pdf = generate_pdf_report(consultation)
+    # Write then rename, so a concurrent request never serves half a file
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(pdf.getbuffer())
+    os.replace(tmp_path, path)
+
+    # Drop renders of earlier versions
+    for stale in glob.glob(os.path.join(cache_dir, f"{consultation.pk}-*.pdf")):
+        if stale != path:
+            try:
+                os.remove(stale)
+            except OSError:
+                pass
+    return path
+
+
+def generate_pdf_reports_bulk(consultations):
+    """
+    Generate PDF reports for many consultations, yielding (ReportData,
+    PDF buffer) pairs one at a time in the same order. With a lazy input
+    (e.g. queryset.iterator()) only the current report is held in memory.
+    """
+    from .pdf import render_pdf_report
+
+    # Rendered inline: forking a pool from a web worker that has live
+    # threads (asyncio executor, ONNX Runtime) risks deadlocked children,
+    # and threads wouldn't help CPU-bound pure-Python rendering
+    for consultation in consultations:
+        report = ReportData.from_consultation(consultation)
+        yield report, render_pdf_report(report)
@@ -1,47 +1,109 @@
 import os
+import base64
+import csv
+import hashlib
 import json
 import re
-from datetime import timedelta
+from datetime import datetime, time, timedelta
+from functools import lru_cache
+from itertools import islice
 
-from django.shortcuts import render, redirect, get_object_or_404
-from django.http import StreamingHttpResponse, JsonResponse, HttpResponse
-from django.db.models import Q, Count
+import orjson
+
+from asgiref.sync import sync_to_async
+from django.shortcuts import render, redirect, get_object_or_404, aget_object_or_404
+from django.http import StreamingHttpResponse, JsonResponse, FileResponse, Http404
+from django.db.models import Count, Q
+from django.db.models.functions import TruncMonth
 from django.utils import timezone
+from django.utils.dateparse import parse_date
+from django.utils.functional import cached_property
+from django.views.decorators.cache import cache_page
+from django.views.decorators.http import condition
+from django.views.decorators.vary import vary_on_cookie
 from django.contrib import messages
-from django.core.paginator import Paginator
+from django.core.paginator import InvalidPage, Page, Paginator
 from django.conf import settings as django_settings
+from django.core.cache import cache
 
 # Import the new service we created
 from .services import LLMService 
+from .ml_service import MLService
 from .models import Consultation, SystemSettings, AnalyticsSnapshot
 from .forms import ConsultationForm, ConsultationEditForm, SystemSettingsForm
-from .utils import generate_pdf_report
+from .utils import cached_pdf_report, consultation_version
+from .signals import HOME_STATS_KEY, DASHBOARD_STATS_KEY, ANALYTICS_STATS_KEY, history_count_version
+
+# Server-sent event frames are built as bytes so StreamingHttpResponse
+# can pass them straight through without re-encoding each one
+SSE_START_FRAME = b'data: {"type": "start"}\n\n'
+
+
+def sse_frame(payload):
+    # orjson encodes straight to UTF-8 bytes
+    return b'data: ' + orjson.dumps(payload) + b'\n\n'
+
+
+def day_start(date):
+    # created_at__date / __year / __month wrap the column in a function
+    # and can't use its index; filter on [day_start(a), day_start(b)) instead
+    return timezone.make_aware(datetime.combine(date, time.min))
+
+
+@lru_cache(maxsize=None)
+def get_llm_service():
+    # One instance per process: it only holds config, and the HTTP client
+    # it streams over is shared per event loop (see LLMService._get_client)
+    return LLMService()
+
+
+def get_inference_service():
+    # Prefer the in-process model; the Inference API is only the fallback
+    # when it couldn't be loaded (e.g. onnxruntime not installed). The
+    # first call in a process that didn't preload the model loads it.
+    MLService.ensure_loaded()
+    if MLService.is_loaded():
+        return MLService()
+    return get_llm_service()
+
 
 # ==================== PUBLIC PAGES ====================
+# Whole responses are cached. vary_on_cookie keeps a page rendered with
+# someone's flash messages out of everyone else's cache entry.
 
+# Fixed at class definition, so counted once at import
+LANGUAGES_SUPPORTED = len(Consultation.LANGUAGE_CHOICES)
+
+
+@cache_page(60)
+@vary_on_cookie
 def home(request):
     """Homepage/Landing page"""
-    total_consultations = Consultation.objects.count()
-    languages_supported = len(Consultation.LANGUAGE_CHOICES)
-    
-    week_ago = timezone.now() - timedelta(days=7)
-    recent_consultations = Consultation.objects.filter(
-        created_at__gte=week_ago
-    ).count()
+    def stats():
+        week_ago = timezone.now() - timedelta(days=7)
+        return {
+            'total_consultations': Consultation.objects.count(),
+            'recent_consultations': Consultation.objects.filter(
+                created_at__gte=week_ago
+            ).count(),
+        }
     
     context = {
-        'total_consultations': total_consultations,
-        'languages_supported': languages_supported,
-        'recent_consultations': recent_consultations,
+        **cache.get_or_set(HOME_STATS_KEY, stats, 300),
+        'languages_supported': LANGUAGES_SUPPORTED,
     }
     return render(request, 'consultations/home.html', context)
 
 
+@cache_page(60 * 60)
+@vary_on_cookie
 def about(request):
     """About MedInsight page"""
     return render(request, 'consultations/about.html')
 
 
+@cache_page(60 * 60)
+@vary_on_cookie
 def help_page(request):
     """Help & Documentation page"""
     return render(request, 'consultations/help.html')
@@ -51,38 +113,47 @@ def help_page(request):
 
 def dashboard(request):
     """Main dashboard with stats and recent consultations"""
-    today = timezone.now().date()
-    today_consultations = Consultation.objects.filter(created_at__date=today).count()
-    
-    week_start = today - timedelta(days=today.weekday())
-    week_consultations = Consultation.objects.filter(created_at__date__gte=week_start).count()
-    
-    month_consultations = Consultation.objects.filter(
-        created_at__year=today.year,
-        created_at__month=today.month
-    ).count()
+    def stats():
+        today = timezone.localdate()
+        today_start = day_start(today)
+        tomorrow_start = day_start(today + timedelta(days=1))
+        week_start = day_start(today - timedelta(days=today.weekday()))
+        month_start = day_start(today.replace(day=1))
+        next_month_start = day_start((today.replace(day=1) + timedelta(days=32)).replace(day=1))
+        
+        # All counters in one scan instead of one COUNT query each
+        counts = Consultation.objects.aggregate(
+            today=Count('id', filter=Q(created_at__gte=today_start, created_at__lt=tomorrow_start)),
+            week=Count('id', filter=Q(created_at__gte=week_start)),
+            month=Count('id', filter=Q(created_at__gte=month_start, created_at__lt=next_month_start)),
+            total=Count('id'),
+            reviewed=Count('id', filter=Q(is_reviewed=True)),
+        )
+        counts['language_stats'] = list(Consultation.objects.values('language').annotate(
+            count=Count('id')
+        ).order_by('-count'))
+        return counts
     
-    total_consultations = Consultation.objects.count()
-    reviewed_count = Consultation.objects.filter(is_reviewed=True).count()
-    recent_consultations = Consultation.objects.all()[:10]
+    counts = cache.get_or_set(DASHBOARD_STATS_KEY, stats, 60)
     
-    language_stats = Consultation.objects.values('language').annotate(
-        count=Count('id')
-    ).order_by('-count')
+    # Previews only; the full text columns aren't shown on the dashboard
+    recent_consultations = Consultation.objects.for_list()[:10]
     
-    # Check configuration
+    # Check configuration: the local model's state is known in memory from
+    # startup, so this needs no filesystem check per request
     settings = SystemSettings.load()
     hf_token_configured = bool(os.environ.get("HF_TOKEN") or getattr(settings, 'hf_api_token', None))
+    system_configured = MLService.is_loaded() or hf_token_configured
     
     context = {
-        'today_count': today_consultations,
-        'week_count': week_consultations,
-        'month_count': month_consultations,
-        'total_count': total_consultations,
-        'reviewed_count': reviewed_count,
+        'today_count': counts['today'],
+        'week_count': counts['week'],
+        'month_count': counts['month'],
+        'total_count': counts['total'],
+        'reviewed_count': counts['reviewed'],
         'recent_consultations': recent_consultations,
-        'language_stats': language_stats,
-        'system_configured': hf_token_configured,
+        'language_stats': counts['language_stats'],
+        'system_configured': system_configured,
         'settings': settings,
     }
     return render(request, 'consultations/dashboard.html', context)
@@ -116,29 +187,29 @@ def consultation_result(request, pk):
     })
 
 
-def stream_ai_response(request, pk):
+async def stream_ai_response(request, pk):
     """
-    Stream the AI response using the LLMService.
+    Stream the AI response from the local model (or the LLMService fallback).
+    Async so the worker is free to serve other requests between tokens.
     """
-    consultation = get_object_or_404(Consultation, pk=pk)
+    consultation = await aget_object_or_404(Consultation, pk=pk)
     
-    def event_stream():
+    async def event_stream():
         try:
-            # Initialize the service
-            llm_service = LLMService()
-            yield 'data: {"type": "start"}\n\n'
-            
-            full_text_buffer = ""
+            # Initialize the service; may load the model, so off the loop
+            llm_service = await sync_to_async(get_inference_service, thread_sensitive=False)()
+            yield SSE_START_FRAME
             
             # Use the service's stream generator
-            # This handles prompting, API calls, and DB saving internally
-            for token_content in llm_service.stream_response(consultation):
-                yield f'data: {json.dumps({"type": "chunk", "content": token_content})}\n\n'
-                full_text_buffer += token_content
+            # This handles prompting, generation, and DB saving internally.
+            # LLMService awaits network I/O on the event loop; MLService
+            # runs each blocking generation step in a worker thread.
+            async for token_content in llm_service.astream_response(consultation):
+                yield sse_frame({"type": "chunk", "content": token_content})
             
             # Re-fetch the saved consultation to get the parsed fields
             # (The service saves them before finishing the stream)
-            consultation.refresh_from_db()
+            await consultation.arefresh_from_db()
             
             parsed_data = {
                 'summary': consultation.summary,
@@ -146,11 +217,10 @@ def stream_ai_response(request, pk):
                 'management': consultation.management
             }
             
-            yield f'data: {json.dumps({"type": "complete", "data": parsed_data})}\n\n'
+            yield sse_frame({"type": "complete", "data": parsed_data})
 
         except Exception as e:
-            error_msg = json.dumps({"type": "error", "message": f"AI Service Error: {str(e)}"})
-            yield f'data: {error_msg}\n\n'
+            yield sse_frame({"type": "error", "message": f"AI Service Error: {str(e)}"})
 
     stream_generator = event_stream()
 
@@ -182,6 +252,16 @@ def consultation_edit(request, pk):
     })
 
 
+def consultation_etag(request, pk):
+    # Pending flash messages are rendered into the page, so a response
+    # carrying them is never answered with a 304
+    if messages.get_messages(request):
+        return None
+    row = Consultation.objects.filter(pk=pk).values_list('updated_at', 'is_reviewed').first()
+    return consultation_version(*row) if row else None
+
+
+@condition(etag_func=consultation_etag)
 def consultation_detail(request, pk):
     """View the final consultation details"""
     consultation = get_object_or_404(Consultation, pk=pk)
@@ -192,18 +272,12 @@ def consultation_detail(request, pk):
 
 # ==================== CONSULTATION HISTORY ====================
 
-def consultation_history(request):
-    """Display all consultations with search and filters"""
-    consultations = Consultation.objects.all()
-    
+def filter_consultations(request, consultations):
+    """Apply the history page's search and filter parameters"""
     # Search
-    search_query = request.GET.get('search', '')
+    search_query = request.GET.get('search', '').strip()
     if search_query:
-        consultations = consultations.filter(
-            Q(clinical_case__icontains=search_query) |
-            Q(diagnosis__icontains=search_query) |
-            Q(management__icontains=search_query)
-        )
+        consultations = consultations.search(search_query)
     
     # Filters
     language_filter = request.GET.get('language', '')
@@ -218,73 +292,228 @@ def consultation_history(request):
     
     date_from = request.GET.get('date_from', '')
     date_to = request.GET.get('date_to', '')
-    if date_from:
-        consultations = consultations.filter(created_at__date__gte=date_from)
-    if date_to:
-        consultations = consultations.filter(created_at__date__lte=date_to)
-    
-    # Pagination
-    paginator = Paginator(consultations, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    try:
+        start, end = parse_date(date_from), parse_date(date_to)
+    except ValueError:
+        # Well-formed but impossible dates (e.g. 2024-02-30) are ignored
+        start = end = None
+    if start:
+        consultations = consultations.filter(created_at__gte=day_start(start))
+    if end:
+        consultations = consultations.filter(created_at__lt=day_start(end + timedelta(days=1)))
     
-    context = {
-        'page_obj': page_obj,
+    filters = {
         'search_query': search_query,
         'language_filter': language_filter,
         'status_filter': status_filter,
         'date_from': date_from,
         'date_to': date_to,
+    }
+    return consultations, filters
+
+
+class CachedCountPaginator(Paginator):
+    """
+    Paginator whose COUNT(*) is cached under count_key, so paging through
+    the same filtered list doesn't re-count the matching rows every time.
+    """
+    def __init__(self, object_list, per_page, count_key, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.count_key = count_key
+    
+    @cached_property
+    def count(self):
+        return cache.get_or_set(self.count_key, self.object_list.count, 60)
+    
+    def get_page_after(self, number, cursor):
+        """
+        Like get_page(), but fetch the page as the rows ordered after
+        cursor (the previous page's last row) instead of with OFFSET,
+        which reads and discards every earlier row. Expects the list
+        ordered by ('-created_at', '-pk').
+        """
+        try:
+            number = self.validate_number(number)
+        except InvalidPage:
+            return self.get_page(number)
+        created_at, pk = cursor
+        rows = self.object_list.filter(
+            Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk)
+        )[:self.per_page]
+        return Page(rows, number, self)
+
+
+def encode_cursor(consultation):
+    raw = f"{consultation.created_at.isoformat()}|{consultation.pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        created_at, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(created_at), int(pk)
+    except ValueError:
+        return None
+
+
+def consultation_history(request):
+    """Display all consultations with search and filters"""
+    # Only previews of the text columns are rendered, so don't fetch them
+    consultations, filters = filter_consultations(request, Consultation.objects.for_list())
+    consultations = consultations.order_by('-created_at', '-pk')
+    
+    # Pagination; the count is shared by every page of the same filters
+    count_key = 'history:count:{}:{}'.format(
+        history_count_version(),
+        hashlib.blake2b(json.dumps(filters, sort_keys=True).encode(), digest_size=16).hexdigest(),
+    )
+    paginator = CachedCountPaginator(consultations, 20, count_key)
+    page_number = request.GET.get('page')
+    # Next links carry the last row shown, so walking forward through
+    # the history doesn't get slower with depth
+    cursor = decode_cursor(request.GET.get('after', ''))
+    if cursor and page_number:
+        page_obj = paginator.get_page_after(page_number, cursor)
+    else:
+        page_obj = paginator.get_page(page_number)
+    
+    context = {
+        'page_obj': page_obj,
+        'next_cursor': encode_cursor(page_obj[-1]) if page_obj.has_next() else '',
         'languages': Consultation.LANGUAGE_CHOICES,
+        **filters,
     }
     return render(request, 'consultations/consultation_history.html', context)
 
 
+class Echo:
+    """File-like object for csv.writer that hands each row straight back"""
+    def write(self, value):
+        return value
+
+
+def export_consultations_csv(request):
+    """Export the filtered history as CSV"""
+    consultations, _ = filter_consultations(request, Consultation.objects.only(
+        'id', 'created_at', 'language', 'is_reviewed', 'summary', 'diagnosis', 'management'
+    ))
+    
+    # Rows come from a server-side cursor in chunks, so memory stays flat
+    # however many consultations match. Under ASGI a sync iterator would be
+    # drained into a list before the first byte is sent, so the chunks are
+    # fetched in the sync thread (where the cursor's connection lives) and
+    # yielded from an async generator.
+    writer = csv.writer(Echo())
+    chunk_size = 2000
+    cursor = consultations.iterator(chunk_size=chunk_size)
+    next_chunk = sync_to_async(lambda: list(islice(cursor, chunk_size)))
+    
+    async def rows():
+        yield writer.writerow(['id', 'created_at', 'language', 'reviewed', 'summary', 'diagnosis', 'management'])
+        while chunk := await next_chunk():
+            for c in chunk:
+                yield writer.writerow([
+                    c.pk, c.created_at.isoformat(), c.language, c.is_reviewed,
+                    c.summary or '', c.diagnosis or '', c.management or '',
+                ])
+    
+    response = StreamingHttpResponse(rows(), content_type='text/csv')
+    filename = f"consultations_{timezone.now().strftime('%Y%m%d')}.csv"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
 def consultation_delete(request, pk):
     """Delete a consultation"""
-    consultation = get_object_or_404(Consultation, pk=pk)
-    if request.method == 'POST':
-        consultation.delete()
-        messages.success(request, 'Consultation deleted successfully!')
-        return redirect('consultation_history')
-    return redirect('consultation_detail', pk=pk)
+    if request.method != 'POST':
+        # The detail page does its own 404 check
+        return redirect('consultation_detail', pk=pk)
+    
+    # No separate fetch first; a missing row just deletes nothing. The
+    # post_delete receiver still makes Django load the row, so only the
+    # columns it reads (see consultations.signals) are selected.
+    deleted, _ = Consultation.objects.filter(pk=pk).only('pk', 'created_at').delete()
+    if not deleted:
+        raise Http404('No Consultation matches the given query.')
+    messages.success(request, 'Consultation deleted successfully!')
+    return redirect('consultation_history')
 
 
 # ==================== ANALYTICS ====================
 
+def analytics_etag(request):
+    # The page is a function of the cached stats; before they are cached
+    # there is nothing cheap to compare, so no ETag is offered
+    stats = cache.get(ANALYTICS_STATS_KEY)
+    if stats is None or messages.get_messages(request):
+        return None
+    return hashlib.blake2b(orjson.dumps(stats, option=orjson.OPT_SORT_KEYS), digest_size=16).hexdigest()
+
+
+@condition(etag_func=analytics_etag)
 def analytics(request):
     """Analytics and insights page"""
-    total = Consultation.objects.count()
-    reviewed = Consultation.objects.filter(is_reviewed=True).count()
-    
-    language_data = list(Consultation.objects.values('language').annotate(
-        count=Count('id')
-    ).order_by('-count'))
-    
-    thirty_days_ago = timezone.now() - timedelta(days=30)
-    daily_stats = []
-    for i in range(30):
-        date = (thirty_days_ago + timedelta(days=i)).date()
-        count = Consultation.objects.filter(created_at__date=date).count()
-        daily_stats.append({'date': date.strftime('%Y-%m-%d'), 'count': count})
-    
-    monthly_stats = []
-    for i in range(6):
-        date = timezone.now() - timedelta(days=30*i)
-        count = Consultation.objects.filter(
-            created_at__year=date.year,
-            created_at__month=date.month
-        ).count()
-        monthly_stats.insert(0, {'month': date.strftime('%b %Y'), 'count': count})
-    
-    context = {
-        'total': total,
-        'reviewed': reviewed,
-        'pending': total - reviewed,
-        'language_data': json.dumps(language_data),
-        'daily_stats': json.dumps(daily_stats),
-        'monthly_stats': json.dumps(monthly_stats),
-    }
+    def stats():
+        # One GROUP BY serves both the language chart and the totals
+        per_language = Consultation.objects.values('language').annotate(
+            count=Count('id'),
+            reviewed=Count('id', filter=Q(is_reviewed=True)),
+        ).order_by('-count')
+        language_data = []
+        total = reviewed = 0
+        for row in per_language:
+            total += row['count']
+            reviewed += row['reviewed']
+            language_data.append({'language': row['language'], 'count': row['count']})
+        
+        now = timezone.now()
+        
+        # The daily series covers finished days only, so it is read from the
+        # stored snapshots (see record_analytics). Days without one are
+        # recorded now, so each day is aggregated at most once.
+        thirty_days_ago = now - timedelta(days=30)
+        dates = [(thirty_days_ago + timedelta(days=i)).date() for i in range(30)]
+        daily_counts = dict(
+            AnalyticsSnapshot.objects.filter(date__range=(dates[0], dates[-1]))
+            .values_list('date', 'total_consultations')
+        )
+        missing = [date for date in dates if date not in daily_counts]
+        if missing:
+            for snapshot in AnalyticsSnapshot.record(missing[0], missing[-1]):
+                daily_counts[snapshot.date] = snapshot.total_consultations
+        # orjson writes dates as YYYY-MM-DD itself
+        daily_stats = [
+            {'date': date, 'count': daily_counts.get(date, 0)}
+            for date in dates
+        ]
+        
+        # Months include the current, unfinished one: one live GROUP BY
+        months = [now - timedelta(days=30*i) for i in reversed(range(6))]
+        monthly_counts = {
+            (month.year, month.month): count
+            for month, count in Consultation.objects.filter(
+                created_at__gte=months[0].replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+            )
+            .annotate(month=TruncMonth('created_at'))
+            .values_list('month')
+            .annotate(count=Count('id'))
+        }
+        monthly_stats = [
+            {'month': date.strftime('%b %Y'), 'count': monthly_counts.get((date.year, date.month), 0)}
+            for date in months
+        ]
+        
+        return {
+            'total': total,
+            'reviewed': reviewed,
+            'pending': total - reviewed,
+            'language_data': orjson.dumps(language_data).decode(),
+            'daily_stats': orjson.dumps(daily_stats).decode(),
+            'monthly_stats': orjson.dumps(monthly_stats).decode(),
+        }
+        
+    # Cached as a whole; invalidated by consultations.signals on any change
+    context = cache.get_or_set(ANALYTICS_STATS_KEY, stats, 120)
     return render(request, 'consultations/analytics.html', context)
 
 
@@ -303,8 +532,15 @@ def settings_view(request):
     else:
         form = SystemSettingsForm(instance=settings_obj)
     
-    # We simplified this since we don't have a local model
-    model_info = {'loaded': True, 'type': 'Hugging Face API'}
+    if MLService.is_loaded():
+        model_info = {
+            'loaded': True,
+            'type': 'ONNX Runtime (local)',
+            'path': MLService.model_dir,
+            'precision': MLService.precision,
+        }
+    else:
+        model_info = {'loaded': True, 'type': 'Hugging Face API'}
     
     context = {
         'form': form,
@@ -314,17 +550,51 @@ def settings_view(request):
     return render(request, 'consultations/settings.html', context)
 
 
+def model_info(request):
+    """Which inference backend is active (polled by the settings page)"""
+    if MLService.is_loaded():
+        return JsonResponse({
+            'loaded': True,
+            'type': 'ONNX Runtime (local)',
+            'device': MLService.provider,
+            'precision': MLService.precision,
+        })
+    return JsonResponse({'loaded': False, 'type': 'Hugging Face API', 'device': 'Remote'})
+
+
+def test_model(request):
+    """Run a short generation on the local model (settings page button)"""
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'message': 'POST required'}, status=405)
+    MLService.ensure_loaded()
+    if not MLService.is_loaded():
+        return JsonResponse({
+            'success': False,
+            'message': 'Local model is not loaded; consultations use the Hugging Face Inference API.',
+        })
+    try:
+        output = MLService().smoke_test()
+    except Exception as e:
+        return JsonResponse({'success': False, 'message': f'ONNX Runtime Error: {str(e)}'})
+    return JsonResponse({'success': True, 'message': f'Model responded: {output}'})
+
+
 # ==================== UTILS ====================
 
-def export_consultation_pdf(request, pk):
-    """Export consultation as PDF"""
-    consultation = get_object_or_404(Consultation, pk=pk)
+async def export_consultation_pdf(request, pk):
+    """
+    Export consultation as PDF.
+    Async so rendering runs in the shared thread pool; as a sync view under
+    ASGI it would hold the one thread all sync views are serialised on.
+    Unchanged consultations are served from the rendered file.
+    """
+    consultation = await aget_object_or_404(Consultation, pk=pk)
     try:
-        pdf = generate_pdf_report(consultation)
-        response = HttpResponse(pdf, content_type='application/pdf')
+        path = await sync_to_async(cached_pdf_report, thread_sensitive=False)(consultation)
         filename = f"consultation_{consultation.pk}_{consultation.created_at.strftime('%Y%m%d')}.pdf"
-        response['Content-Disposition'] = f'attachment; filename="{filename}"'
-        return response
+        # Under ASGI Django reads the file in a worker thread and sends it
+        # in blocks; there is no sendfile. Reports are a few dozen KB.
+        return FileResponse(open(path, 'rb'), as_attachment=True, filename=filename, content_type='application/pdf')
     except Exception as e:
         messages.error(request, f'Error generating PDF: {str(e)}')
         return redirect('consultation_detail', pk=pk)
\ No newline at end of file
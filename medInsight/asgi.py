@@ -13,4 +13,24 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'medInsight.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from consultations.services import LLMService  # noqa: E402 (needs the app registry)
+
+
+async def application(scope, receive, send):
+    """
+    Django's handler with ASGI lifespan support, so each uvicorn worker
+    closes its shared Inference API client on shutdown.
+    """
+    if scope['type'] != 'lifespan':
+        return await django_application(scope, receive, send)
+
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await LLMService.aclose_client()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
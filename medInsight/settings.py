@@ -41,6 +41,11 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+if DEBUG:
+    # Logs requests that run more than QUERY_COUNT_WARNING queries (N+1 hunting)
+    MIDDLEWARE.append('consultations.middleware.QueryCountMiddleware')
+    QUERY_COUNT_WARNING = config('QUERY_COUNT_WARNING', default=20, cast=int)
+
 ROOT_URLCONF = 'medInsight.urls'
 
 TEMPLATES = [
@@ -91,3 +96,19 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Local model (consultations.ml_service.MLService)
+# Load it when the process starts instead of on the first consultation. Set
+# for the web process only (Procfile); management commands never need it.
+ML_PRELOAD_MODEL = config('ML_PRELOAD_MODEL', default=False, cast=bool)
+# INT8 dynamic quantization is opt-in: validate parse quality before enabling.
+ML_ENABLE_INT8 = config('ML_ENABLE_INT8', default=False, cast=bool)
+# FP16 weights on GPU only. T5 activations can overflow in fp16, so this is opt-in too.
+ML_ENABLE_FP16 = config('ML_ENABLE_FP16', default=False, cast=bool)
+# Hugging Face repo of a small T5 draft model for speculative decoding (off when empty).
+ML_DRAFT_MODEL = config('ML_DRAFT_MODEL', default='')
+
+# PDF reports: zlib page compression. Costs no measurable render time and
+# shrinks text-heavy reports ~7x; turn off only for local, uncompressed output.
+PDF_COMPRESS = config('PDF_COMPRESS', default=True, cast=bool)
+# Rendered reports are kept here and reused until the consultation changes.
+PDF_CACHE_DIR = config('PDF_CACHE_DIR', default=str(BASE_DIR / 'pdf_cache'))